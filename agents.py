@@ -1,6 +1,17 @@
-from rag import search
-from llm import generate
-from config import REQUIRE_LECTURER_REVIEW
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import semantic_cache
+from rag import search, on_ingest
+from llm import generate_stream, has_error, count_tokens
+from config import (
+    REQUIRE_LECTURER_REVIEW,
+    LLM_BACKEND,
+    LOCAL_LLM_BASE_URL,
+    GGUF_MODEL_PATH,
+)
 
 # ⛑️ Intent detection must NEVER crash chat
 try:
@@ -9,6 +20,23 @@ except Exception:
     def detect_intent(text: str):
         return "default"
 
+# ⚡ Regex fast path for the common cases (microseconds, no model);
+# anything it doesn't recognise falls through to detect_intent.
+# _SHORT_RE matches 1-3 words, same cut-off as detect_intent.
+_GREET_RE = re.compile(
+    r"^\s*(hi|hello|hey|yo|good\s+(morning|afternoon|evening))[\s!.?]*$",
+    re.I
+)
+_SHORT_RE = re.compile(r"^\s*\S{1,30}(\s+\S{1,30}){0,2}[\s!.?]*$")
+
+
+def _fast_intent(text: str):
+    if _GREET_RE.match(text):
+        return "greeting"
+    if _SHORT_RE.match(text):
+        return "short_chat"
+    return None
+
 
 # =========================================================
 # SYSTEM PROMPT (CORE)
@@ -32,89 +60,267 @@ SYSTEM_CORE = (
 )
 
 
+# =========================================================
+# BACKGROUND RETRIEVAL
+# RAG search is submitted early and collected just before the
+# context is formatted, so it overlaps cache lookups + prompt prep.
+# =========================================================
+_EXEC = ThreadPoolExecutor(max_workers=4)
+
+
+# =========================================================
+# ROLE-SPECIFIC SYSTEM PROMPTS (built once at import)
+# =========================================================
+SYSTEM_BY_ROLE = {
+    "admin": (
+        SYSTEM_CORE +
+        "\n\nYou are responding to an ADMIN overseeing AI-supported instruction. "
+        "Emphasize governance, policy alignment, and system-level implications."
+    ),
+    "lecturer": (
+        SYSTEM_CORE +
+        "\n\nYou are responding to a LECTURER. "
+        "Emphasize pedagogy, assessment quality, and instructional strategies."
+    ),
+    "student": (
+        SYSTEM_CORE +
+        "\n\nYou are responding to a STUDENT (pre-service teacher). "
+        "Use supportive tone, examples, and scaffolding."
+    ),
+}
+
+
+# =========================================================
+# USER-PROMPT TEMPLATES (filled with str.format per request)
+# =========================================================
+_LESSON_TMPL = """RAG CONTEXT:
+{ctx}
+
+TASK:
+Create a lesson plan for:
+- Subject: {subject}
+- Topic: {topic}
+- Level: {level}
+- Duration: {duration_min} minutes
+
+Include:
+1) Learning outcomes
+2) Prior knowledge
+3) Materials / ICT tools (low-bandwidth alternatives too)
+4) Step-by-step teacher activities + learner activities
+5) Differentiation aligned to Felder–Silverman
+6) Formative assessment with a short rubric
+7) Reflection prompts for the pre-service teacher
+"""
+
+_FEEDBACK_TMPL = """RAG CONTEXT:
+{ctx}
+
+TASK:
+Evaluate the lesson plan using the rubric and return:
+- Strengths
+- Weaknesses
+- Score breakdown (table)
+- Improvement actions
+- Short feedback email draft
+
+RUBRIC:
+{rubric_text}
+
+LESSON PLAN:
+{lesson_text}
+"""
+
+
 # =========================================================
 # RAG CONTEXT FORMATTER (🔥 SAFE LIMIT)
 # =========================================================
-def _format_context(hits, max_chars: int = 2000):
+def _format_context(hits, max_tokens: int = 512):
     """
     Format RAG hits safely.
-    HARD LIMIT to prevent GGUF context overflow.
+    HARD LIMIT to prevent GGUF context overflow, counted with the
+    model's tokenizer. The budget is checked before a block is
+    built, so hits that would not fit are never formatted.
     """
     if not hits:
         return "No retrieved context."
 
+    # "[i] Source: … (score=0.000)\n" + trailing "\n" (generous)
+    HEADER_TOKENS = 24
+
     lines = []
     total = 0
 
     for i, h in enumerate(hits, 1):
-        block = (
+        block_toks = count_tokens(h["text"]) + HEADER_TOKENS
+        if total + block_toks > max_tokens:
+            break
+
+        lines.append(
             f"[{i}] Source: {h['source']} (score={h['score']:.3f})\n"
             f"{h['text']}\n"
         )
+        total += block_toks
 
-        total += len(block)
-        if total > max_chars:
-            break
+    return "\n".join(lines)
 
-        lines.append(block)
 
-    return "\n".join(lines)
+# =========================================================
+# RESPONSE CACHES (L1 exact → L2 semantic)
+# Cache failures must NEVER crash chat; callers only store
+# replies whose stream had no error piece (llm.has_error).
+#
+# Every ingest bumps the generation. Callers read it before
+# retrieval and pass it to the store helpers, so a reply built
+# from the old knowledge base is dropped instead of being
+# written after the ingest already cleared the caches.
+# =========================================================
+_generation = 0
+_generation_lock = threading.Lock()
+
+# L1 lives on disk across restarts, so its keys name what produced
+# the reply. Bump PROMPT_VERSION whenever a system prompt, template
+# or generation limit in this file changes.
+PROMPT_VERSION = 1
+_KEY_PREFIX = (
+    LLM_BACKEND,
+    LOCAL_LLM_BASE_URL if LLM_BACKEND == "api" else GGUF_MODEL_PATH,
+    PROMPT_VERSION,
+)
+
+
+def _cache_key(kind: str, *parts, raw=()) -> str:
+    return cache.make_key(kind, *_KEY_PREFIX, *parts, raw=raw)
+
+
+def _cache_generation():
+    return _generation
+
+
+def _exact_lookup(key: str):
+    try:
+        return cache.exact_get(key)
+    except Exception as e:
+        print("[CACHE ERROR]", str(e))
+        return None
+
+
+def _exact_store(key: str, reply: str, generation: int):
+    with _generation_lock:
+        if generation != _generation:
+            return  # an ingest ran meanwhile: reply may be stale
+        try:
+            cache.exact_set(key, reply)
+        except Exception as e:
+            print("[CACHE ERROR]", str(e))
+
+
+def _semantic_lookup(query: str, scope):
+    try:
+        return semantic_cache.get(query, scope)
+    except Exception as e:
+        print("[CACHE ERROR]", str(e))
+        return None
+
+
+def _semantic_store(query: str, reply: str, scope, hits, generation: int):
+    with _generation_lock:
+        if generation != _generation:
+            return
+        try:
+            semantic_cache.put(query, reply, scope, {h["source"] for h in hits})
+        except Exception as e:
+            print("[CACHE ERROR]", str(e))
+
+
+@on_ingest
+def _next_generation(source):
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+# New knowledge makes cached answers stale: the semantic cache drops
+# answers built from the re-ingested source; exact-match keys carry no
+# source information, so that cache is emptied. Registered after the
+# generation bump, so no store can slip in behind these clears.
+on_ingest(semantic_cache.invalidate)
+on_ingest(lambda source: cache.clear())
 
 
 # =========================================================
 # ROLE-AWARE CHAT (SAFE + FINAL)
 # =========================================================
 def tutor_chat_with_role(user_message: str, role: str):
+    """
+    Blocking wrapper around tutor_chat_with_role_stream().
+    """
+    return "".join(tutor_chat_with_role_stream(user_message, role))
+
+
+def tutor_chat_with_role_stream(user_message: str, role: str):
     """
     Single, safe entry point for ALL chat requests.
+    Yields the reply in pieces as the LLM produces it.
     Used by /api/chat.
     """
 
     # 🔹 SAFE intent detection
     try:
-        intent = detect_intent(user_message)
+        intent = _fast_intent(user_message) or detect_intent(user_message)
     except Exception:
         intent = "default"
 
     # 🔹 Greetings NEVER hit GGUF (fast + safe)
     if intent == "greeting":
-        return "Hello 👋 How can I help you today?"
+        yield "Hello 👋 How can I help you today?"
+        return
+
+    generation = _cache_generation()
+
+    # 🔹 L1: exact repeat of a previous question
+    key = _cache_key("chat", role, user_message)
+    cached = _exact_lookup(key)
+    if cached is not None:
+        yield cached
+        return
 
     # 🔹 Short chat = VERY light GGUF call
     if intent == "short_chat":
-        return generate(
+        parts = []
+        for piece in generate_stream(
             "You are a friendly assistant. Respond briefly and naturally.",
             user_message,
             max_tokens=100
-        )
+        ):
+            parts.append(piece)
+            yield piece
+
+        if not has_error(parts):
+            _exact_store(key, "".join(parts), generation)
+        return
+
+    # 🔹 L2: semantically equivalent question (skips retrieval + LLM)
+    scope = (role, intent)
+    cached = _semantic_lookup(user_message, scope)
+    if cached is not None:
+        yield cached
+        return
+
+    # 🔹 Start retrieval now so it runs while the prompt is prepared
+    #    (very short messages never get here: they are short_chat)
+    hits_future = _EXEC.submit(search, user_message)
 
     # =====================================================
     # ROLE-AWARE SYSTEM PROMPT
     # =====================================================
-    if role == "admin":
-        system_prompt = (
-            SYSTEM_CORE +
-            "\n\nYou are responding to an ADMIN overseeing AI-supported instruction. "
-            "Emphasize governance, policy alignment, and system-level implications."
-        )
-    elif role == "lecturer":
-        system_prompt = (
-            SYSTEM_CORE +
-            "\n\nYou are responding to a LECTURER. "
-            "Emphasize pedagogy, assessment quality, and instructional strategies."
-        )
-    else:
-        system_prompt = (
-            SYSTEM_CORE +
-            "\n\nYou are responding to a STUDENT (pre-service teacher). "
-            "Use supportive tone, examples, and scaffolding."
-        )
+    system_prompt = SYSTEM_BY_ROLE.get(role, SYSTEM_BY_ROLE["student"])
 
     # =====================================================
     # RAG + LLM (🔥 SAFE LIMITS)
     # =====================================================
-    hits = search(user_message)
-    ctx = _format_context(hits, max_chars=2000)
+    hits = hits_future.result()
+    ctx = _format_context(hits, max_tokens=512)
 
     user_prompt = (
         f"Context:\n{ctx}\n\n"
@@ -125,90 +331,140 @@ def tutor_chat_with_role(user_message: str, role: str):
         "- Only go deep if the user signals readiness"
     )
 
-    return generate(
+    parts = []
+    for piece in generate_stream(
         system_prompt,
         user_prompt,
         max_tokens=256  # 🔥 CRITICAL: prevents GGUF 500 errors
-    )
+    ):
+        parts.append(piece)
+        yield piece
+
+    # Only reached when the stream ran to completion
+    if has_error(parts):
+        return
+    reply = "".join(parts)
+    _exact_store(key, reply, generation)
+    _semantic_store(user_message, reply, scope, hits, generation)
 
 
 # =========================================================
 # LESSON PLAN GENERATOR (SAFE)
 # =========================================================
+_LESSON_REVIEW_NOTE = (
+    "\n\nLECTURER REVIEW CHECKLIST:\n"
+    "- Verify curriculum alignment\n"
+    "- Check cultural relevance\n"
+    "- Confirm assessment fairness\n"
+    "- Confirm ICT feasibility\n"
+)
+
+
 def generate_lesson_plan(topic: str, level: str, subject: str, duration_min: int):
-    hits = search(f"{subject} {topic} curriculum objectives lesson plan")
-    ctx = _format_context(hits, max_chars=2000)
+    """
+    Blocking wrapper around generate_lesson_plan_stream().
+    """
+    return "".join(
+        generate_lesson_plan_stream(topic, level, subject, duration_min)
+    )
 
-    user_prompt = f"""RAG CONTEXT:
-{ctx}
 
-TASK:
-Create a lesson plan for:
-- Subject: {subject}
-- Topic: {topic}
-- Level: {level}
-- Duration: {duration_min} minutes
+def generate_lesson_plan_stream(topic: str, level: str, subject: str, duration_min: int):
+    generation = _cache_generation()
+    hits_future = _EXEC.submit(
+        search, f"{subject} {topic} curriculum objectives lesson plan"
+    )
 
-Include:
-1) Learning outcomes
-2) Prior knowledge
-3) Materials / ICT tools (low-bandwidth alternatives too)
-4) Step-by-step teacher activities + learner activities
-5) Differentiation aligned to Felder–Silverman
-6) Formative assessment with a short rubric
-7) Reflection prompts for the pre-service teacher
-"""
+    key = _cache_key("lesson", subject, topic, level, duration_min)
+    cached = _exact_lookup(key)
+    if cached is not None:
+        hits_future.cancel()
+        yield cached
+        return
+
+    hits = hits_future.result()
+    ctx = _format_context(hits, max_tokens=512)
+
+    user_prompt = _LESSON_TMPL.format(
+        ctx=ctx,
+        subject=subject,
+        topic=topic,
+        level=level,
+        duration_min=duration_min,
+    )
 
-    plan = generate(
+    parts = []
+    for piece in generate_stream(
         SYSTEM_CORE,
         user_prompt,
         max_tokens=512
-    )
+    ):
+        parts.append(piece)
+        yield piece
+
+    if has_error(parts):
+        return
+    plan = "".join(parts)
 
     if REQUIRE_LECTURER_REVIEW:
-        plan += (
-            "\n\nLECTURER REVIEW CHECKLIST:\n"
-            "- Verify curriculum alignment\n"
-            "- Check cultural relevance\n"
-            "- Confirm assessment fairness\n"
-            "- Confirm ICT feasibility\n"
-        )
+        yield _LESSON_REVIEW_NOTE
+        plan += _LESSON_REVIEW_NOTE
 
-    return plan
+    _exact_store(key, plan, generation)
 
 
 # =========================================================
 # RUBRIC FEEDBACK GENERATOR (SAFE)
 # =========================================================
+_FEEDBACK_REVIEW_NOTE = (
+    "\n\nNOTE: Lecturer must validate this feedback before final submission."
+)
+
+
 def rubric_feedback(lesson_text: str, rubric_text: str):
-    hits = search("practicum supervision rubric lesson plan evaluation")
-    ctx = _format_context(hits, max_chars=2000)
+    """
+    Blocking wrapper around rubric_feedback_stream().
+    """
+    return "".join(rubric_feedback_stream(lesson_text, rubric_text))
 
-    user_prompt = f"""RAG CONTEXT:
-{ctx}
 
-TASK:
-Evaluate the lesson plan using the rubric and return:
-- Strengths
-- Weaknesses
-- Score breakdown (table)
-- Improvement actions
-- Short feedback email draft
+def rubric_feedback_stream(lesson_text: str, rubric_text: str):
+    generation = _cache_generation()
+    hits_future = _EXEC.submit(
+        search, "practicum supervision rubric lesson plan evaluation"
+    )
 
-RUBRIC:
-{rubric_text}
+    key = _cache_key("feedback", raw=(lesson_text, rubric_text))
+    cached = _exact_lookup(key)
+    if cached is not None:
+        hits_future.cancel()
+        yield cached
+        return
 
-LESSON PLAN:
-{lesson_text}
-"""
+    hits = hits_future.result()
+    ctx = _format_context(hits, max_tokens=512)
 
-    fb = generate(
+    user_prompt = _FEEDBACK_TMPL.format(
+        ctx=ctx,
+        rubric_text=rubric_text,
+        lesson_text=lesson_text,
+    )
+
+    parts = []
+    for piece in generate_stream(
         SYSTEM_CORE,
         user_prompt,
         max_tokens=384
-    )
+    ):
+        parts.append(piece)
+        yield piece
+
+    if has_error(parts):
+        return
+    fb = "".join(parts)
 
     if REQUIRE_LECTURER_REVIEW:
-        fb += "\n\nNOTE: Lecturer must validate this feedback before final submission."
+        yield _FEEDBACK_REVIEW_NOTE
+        fb += _FEEDBACK_REVIEW_NOTE
 
-    return fb
+    _exact_store(key, fb, generation)
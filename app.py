@@ -1,35 +1,82 @@
 import os
+import io
+import csv
+import json
+import threading
 import sqlite3
-import statistics
-from datetime import datetime
+import orjson
 from functools import wraps
 from flask_cors import CORS
 from flask import (
     Flask, request, render_template,
-    redirect, url_for, session, flash, send_file
+    redirect, url_for, session, flash,
+    Response, stream_with_context, make_response
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask.json.provider import JSONProvider
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from pydantic import ValidationError
 
 # =============================
 # IMPORT EXISTING MODULES
 # =============================
-from config import KB_DIR, UPLOAD_DIR
-from db import init_db as init_logs_db, log_interaction, recent_logs
-from rag import ingest_text
-#from agents import tutor_chat,  generate_lesson_plan, rubric_feedback
-from agents import tutor_chat_with_role, generate_lesson_plan, rubric_feedback
+from config import KB_DIR, UPLOAD_DIR, EMBED_WARMUP
+from db import (
+    init_db as init_logs_db,
+    log_interaction,
+    recent_logs,
+    logs_version,
+    get_conn,
+    maybe_optimize,
+    refresh_stats,
+    schema_version,
+    set_schema_version,
+    SQL_NOW
+)
+from rag import ingest_text, warm_up
+from agents import (
+    tutor_chat_with_role_stream,
+    generate_lesson_plan_stream,
+    rubric_feedback_stream
+)
 from schemas import ChatRequest, LessonRequest, FeedbackRequest
 
 # =============================
 # FLASK INITIALIZATION
 # =============================
+class ORJSONProvider(JSONProvider):
+    """
+    app.json backed by orjson: jsonify(), dict returns and
+    request.get_json() all go through the C encoder/decoder.
+    """
+
+    @staticmethod
+    def _default(obj):
+        if isinstance(obj, sqlite3.Row):
+            return dict(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self._default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # bytes straight into the response, no str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self._default),
+            mimetype="application/json"
+        )
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = "CHANGE_THIS_TO_A_RANDOM_SECRET_KEY"
 CORS(app)
 USER_DB = "users.db"
 SURVEY_DB = "survey.db"
-EXPORT_CSV = "survey_dataset.csv"
 
 os.makedirs(KB_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -39,21 +86,18 @@ init_logs_db()
 # DATABASE HELPERS
 # =============================
 def user_db():
-    conn = sqlite3.connect(USER_DB)
+    conn = get_conn(USER_DB)
     conn.row_factory = sqlite3.Row
     return conn
 
 def survey_db():
     """
-    Returns a valid survey DB connection.
+    Returns this thread's survey DB connection (callers must not close it).
     If survey.db exists but is corrupted (not a database),
     recreate it safely.
     """
     try:
-        conn = sqlite3.connect(SURVEY_DB)
-        # quick integrity probe
-        conn.execute("SELECT 1")
-        return conn
+        return get_conn(SURVEY_DB)
     except sqlite3.DatabaseError:
         # corrupted file: remove and recreate
         try:
@@ -61,8 +105,15 @@ def survey_db():
                 os.remove(SURVEY_DB)
         except Exception:
             pass
-        conn = sqlite3.connect(SURVEY_DB)
-        return conn
+        return get_conn(SURVEY_DB)
+
+
+@app.teardown_appcontext
+def _optimize_dbs(exc):
+    try:
+        maybe_optimize()
+    except sqlite3.Error as e:
+        print("[DB] PRAGMA optimize failed:", str(e))
 
 # =============================
 # INIT DATABASES
@@ -85,37 +136,17 @@ def init_users_db():
     # Seed default admin
     cur.execute("SELECT COUNT(*) FROM users WHERE role='admin'")
     if cur.fetchone()[0] == 0:
-        cur.execute("""
+        cur.execute(f"""
             INSERT INTO users (username, password_hash, role, created_at)
-            VALUES (?, ?, 'admin', ?)
+            VALUES (?, ?, 'admin', {SQL_NOW})
         """, (
             "admin",
-            generate_password_hash("admin123"),
-            datetime.utcnow().isoformat()
+            hash_password("admin123")
         ))
         conn.commit()
         print("✅ Default admin created (admin / admin123)")
 
-    conn.close()
-
-
-# def init_survey_db():
-#     conn = survey_db()
-#     cur = conn.cursor()
-
-#     cur.execute("""
-#         CREATE TABLE IF NOT EXISTS likert_responses (
-#             id INTEGER PRIMARY KEY AUTOINCREMENT,
-#             respondent TEXT NOT NULL,
-#             question TEXT NOT NULL,
-#             score INTEGER NOT NULL CHECK(score BETWEEN 1 AND 5),
-#             role TEXT NOT NULL,
-#             created_at TEXT NOT NULL
-#         )
-#     """)
-
-#     conn.commit()
-#     conn.close()
+    refresh_stats(conn)
 
 
 def init_survey_db():
@@ -176,19 +207,71 @@ def init_survey_db():
     """)
 
     conn.commit()
-    conn.close()
+    refresh_stats(conn)
+
+
+# Bump when the DDL above changes
+USERS_SCHEMA_VERSION = 1
+SURVEY_SCHEMA_VERSION = 1
 
+def _ensure_schema():
+    """
+    Run each init only when the file's PRAGMA user_version is behind
+    the code (first start, or after a schema bump).
+    """
+    if schema_version(user_db()) < USERS_SCHEMA_VERSION:
+        init_users_db()
+        set_schema_version(user_db(), USERS_SCHEMA_VERSION)
+
+    if schema_version(survey_db()) < SURVEY_SCHEMA_VERSION:
+        init_survey_db()
+        set_schema_version(survey_db(), SURVEY_SCHEMA_VERSION)
 
 
 # =============================
 # AUTH HELPERS
 # =============================
+# Argon2id tuned for latency: 2 passes over 64 MiB on 2 lanes
+_PH = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=2)
+
+def hash_password(password):
+    return _PH.hash(password)
+
+def verify_password(stored_hash, password):
+    """
+    Returns (ok, upgraded_hash).
+    Accounts created before the argon2 switch still carry werkzeug
+    hashes (or argon2 with older parameters); on a successful check
+    they get a current argon2 hash to store.
+    """
+    if stored_hash.startswith("$argon2"):
+        try:
+            _PH.verify(stored_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False, None
+        # argon2 hashes made with other parameters are re-hashed too
+        if _PH.check_needs_rehash(stored_hash):
+            return True, hash_password(password)
+        return True, None
+
+    if check_password_hash(stored_hash, password):
+        return True, hash_password(password)
+    return False, None
+
+def set_password_hash(uid, password_hash):
+    conn = user_db()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE users SET password_hash=? WHERE id=?",
+        (password_hash, uid)
+    )
+    conn.commit()
+
 def get_user(username):
     conn = user_db()
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE username=?", (username,))
     u = cur.fetchone()
-    conn.close()
     return u
 
 def get_user_by_id(uid):
@@ -196,7 +279,6 @@ def get_user_by_id(uid):
     cur = conn.cursor()
     cur.execute("SELECT * FROM users WHERE id=?", (uid,))
     u = cur.fetchone()
-    conn.close()
     return u
 
 # =============================
@@ -230,11 +312,15 @@ def login():
         password = request.form.get("password", "")
 
         user = get_user(username)
+        ok, upgraded = verify_password(user["password_hash"], password) if user else (False, None)
 
-        if not user or not check_password_hash(user["password_hash"], password):
+        if not ok:
             flash("Invalid credentials", "error")
             return redirect(url_for("login"))
 
+        if upgraded:
+            set_password_hash(user["id"], upgraded)
+
         session.update({
             "user_id": user["id"],
             "username": user["username"],
@@ -262,6 +348,20 @@ def home():
         role=session.get("role")
     )
 
+# =============================
+# STREAMING HELPERS (SSE)
+# =============================
+def _sse(text):
+    # JSON-encode so newlines in the text can't break SSE framing
+    return f"data: {json.dumps(text)}\n\n"
+
+def _event_stream(gen):
+    return Response(
+        stream_with_context(gen),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # =============================
 # API ROUTES (PLAIN TEXT)
 # =============================
@@ -296,31 +396,33 @@ def api_ingest():
 @login_required
 def api_chat():
     try:
-        payload = request.get_json(force=True, silent=True) or {}
-        req = ChatRequest(**payload)
+        req = ChatRequest.model_validate_json(request.get_data(cache=False))
     except ValidationError as e:
         return f"Validation error: {e}", 400
     except Exception as e:
         return f"Error parsing request: {e}", 400
 
-    try:
-        out = tutor_chat_with_role(
-            req.message,
-            session.get("role", "student")
-        )
+    role = session.get("role", "student")
+
+    def events():
+        parts = []
+        try:
+            for piece in tutor_chat_with_role_stream(req.message, role):
+                parts.append(piece)
+                yield _sse(piece)
+        except Exception as e:
+            yield _sse(f"Error in chat engine: {e}")
+            return
 
         log_interaction(
-            role=session.get("role", "student"),
+            role=role,
             action="chat",
             user_input=req.message,
-            output=out,
+            output="".join(parts),
             approved=0
         )
 
-        return out
-
-    except Exception as e:
-        return f"Error in chat engine: {e}", 500
+    return _event_stream(events())
 
 
 
@@ -329,32 +431,38 @@ def api_chat():
 @role_required("admin", "lecturer")
 def api_lesson():
     try:
-        payload = request.get_json(force=True, silent=True) or {}
-        req = LessonRequest(**payload)
+        req = LessonRequest.model_validate_json(request.get_data(cache=False))
     except ValidationError as e:
         return f"Validation error: {e}", 400
     except Exception as e:
         return f"Error parsing request: {e}", 400
 
-    try:
-        out = generate_lesson_plan(
-            topic=req.topic,
-            level=req.level,
-            subject=req.subject,
-            duration_min=req.duration_min
-        )
+    role = session.get("role")
+
+    def events():
+        parts = []
+        try:
+            for piece in generate_lesson_plan_stream(
+                topic=req.topic,
+                level=req.level,
+                subject=req.subject,
+                duration_min=req.duration_min
+            ):
+                parts.append(piece)
+                yield _sse(piece)
+        except Exception as e:
+            yield _sse(f"Error generating lesson: {e}")
+            return
 
         log_interaction(
-            role=session.get("role"),
+            role=role,
             action="lesson_plan",
             user_input=f"{req.subject} | {req.topic}",
-            output=out,
+            output="".join(parts),
             approved=0
         )
 
-        return out
-    except Exception as e:
-        return f"Error generating lesson: {e}", 500
+    return _event_stream(events())
 
 
 @app.post("/api/feedback")
@@ -362,27 +470,52 @@ def api_lesson():
 @role_required("admin", "lecturer")
 def api_feedback():
     try:
-        payload = request.get_json(force=True, silent=True) or {}
-        req = FeedbackRequest(**payload)
+        req = FeedbackRequest.model_validate_json(request.get_data(cache=False))
     except ValidationError as e:
         return f"Validation error: {e}", 400
     except Exception as e:
         return f"Error parsing request: {e}", 400
 
-    try:
-        out = rubric_feedback(req.lesson_text, req.rubric_text)
+    role = session.get("role")
+
+    def events():
+        parts = []
+        try:
+            for piece in rubric_feedback_stream(req.lesson_text, req.rubric_text):
+                parts.append(piece)
+                yield _sse(piece)
+        except Exception as e:
+            yield _sse(f"Error generating feedback: {e}")
+            return
 
         log_interaction(
-            role=session.get("role"),
+            role=role,
             action="rubric_feedback",
             user_input="lesson+rubric",
-            output=out,
+            output="".join(parts),
             approved=0
         )
 
-        return out
-    except Exception as e:
-        return f"Error generating feedback: {e}", 500
+    return _event_stream(events())
+
+
+# =============================
+# CONDITIONAL GET (ETag / 304)
+# Polled admin views answer 304 from one tiny aggregate query
+# when nothing has changed since the client's last copy.
+# =============================
+def _not_modified(etag):
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+    return None
+
+def _with_etag(body, etag):
+    resp = make_response(body)
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "no-cache"  # always revalidate
+    return resp
 
 
 @app.get("/api/logs")
@@ -390,19 +523,22 @@ def api_feedback():
 @role_required("admin")
 def api_logs():
     try:
+        etag = f"logs-{logs_version()}"
+        cached = _not_modified(etag)
+        if cached is not None:
+            return cached
+
         rows = recent_logs(30)
         if not rows:
-            return "No logs yet."
-
-        lines = []
-        for r in rows:
-            _id, ts, role, action, approved, reviewer, inp, outp = r
-            lines.append(
-                f"- id={_id} | {ts} | {role} | {action} | approved={approved}\n"
-                f"  in: {inp}\n"
-                f"  out: {outp}\n"
-            )
-        return "\n".join(lines)
+            return _with_etag("No logs yet.", etag)
+
+        body = "\n".join(
+            f"- id={_id} | {ts} | {role} | {action} | approved={approved}\n"
+            f"  in: {inp}\n"
+            f"  out: {outp}\n"
+            for _id, ts, role, action, approved, reviewer, inp, outp in rows
+        )
+        return _with_etag(body, etag)
     except Exception as e:
         return f"Error reading logs: {e}", 500
 
@@ -411,51 +547,72 @@ def api_logs():
 # =============================
 # SURVEY ROUTES
 # =============================
-@app.post("/api/survey/submit")
-@login_required
-def submit_survey():
-    if session.get("role") not in ("student", "lecturer", "admin"):
-        return "Forbidden", 403
+_SURVEY_COLS = [f"R{i}" for i in range(1, 41)]
 
-    data = request.get_json(force=True, silent=True)
-    if not data:
-        return "Invalid JSON payload", 400
+# Built once: identical SQL text also lets sqlite3 reuse the
+# prepared statement from its per-connection cache.
+_SURVEY_INSERT_SQL = (
+    f"INSERT INTO likert_responses ({', '.join(_SURVEY_COLS)}, role, created_at) "
+    f"VALUES ({', '.join(['?'] * (len(_SURVEY_COLS) + 1))}, {SQL_NOW})"
+)
 
-    role = data.get("role") or session.get("role")
+# One pass in SQLite: sum of answers, number of answers, respondents
+_SURVEY_ANALYSIS_SQL = (
+    "SELECT "
+    f"SUM({' + '.join(f'COALESCE({c}, 0)' for c in _SURVEY_COLS)}), "
+    f"SUM({' + '.join(f'({c} IS NOT NULL)' for c in _SURVEY_COLS)}), "
+    "COUNT(*) "
+    "FROM likert_responses"
+)
 
-    responses = {}
-    for i in range(1, 41):
-        key = f"R{i}"
+def _survey_error(data):
+    """
+    Slow path, only for rejected submissions: name the offending field.
+    """
+    for key in _SURVEY_COLS:
         if key not in data:
-            return f"Missing {key}", 400
+            return f"Missing {key}"
         try:
             v = int(data[key])
         except Exception:
-            return f"Invalid value for {key}", 400
+            return f"Invalid value for {key}"
         if v < 1 or v > 5:
-            return f"{key} must be between 1 and 5", 400
-        responses[key] = v
+            return f"{key} must be between 1 and 5"
+    return "Invalid survey payload"
+
+@app.post("/api/survey/submit")
+@login_required
+def submit_survey():
+    if session.get("role") not in ("student", "lecturer", "admin"):
+        return "Forbidden", 403
 
     try:
-        conn = survey_db()
-        cur = conn.cursor()
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        data = None
+    if not data or not isinstance(data, dict):
+        return "Invalid JSON payload", 400
 
-        columns = ", ".join(responses.keys())
-        placeholders = ", ".join(["?"] * len(responses))
+    role = data.get("role") or session.get("role")
 
-        sql = f"""
-            INSERT INTO likert_responses
-            ({columns}, role, created_at)
-            VALUES ({placeholders}, ?, ?)
-        """
+    # Fast path: one pass over the fixed column order, no dict
+    try:
+        vals = [int(data[k]) for k in _SURVEY_COLS]
+        valid = all(1 <= v <= 5 for v in vals)
+    except (KeyError, ValueError, TypeError):
+        valid = False
 
-        cur.execute(
-            sql,
-            (*responses.values(), role, datetime.utcnow().isoformat())
-        )
+    if not valid:
+        return _survey_error(data), 400
 
+    try:
+        conn = survey_db()
+        conn.execute(
+            _SURVEY_INSERT_SQL,
+            (*vals, role)
+        )
         conn.commit()
-        conn.close()
+        _bump_survey_count()
         return "Survey submitted successfully"
 
     except Exception as e:
@@ -463,8 +620,6 @@ def submit_survey():
 
 
 
-import statistics
-
 @app.get("/api/survey/analysis")
 @login_required
 @role_required("admin")
@@ -473,33 +628,17 @@ def survey_analysis():
         conn = survey_db()
         cur = conn.cursor()
 
-        # Fetch all R1–R40 values
-        cur.execute("""
-            SELECT
-                R1, R2, R3, R4, R5, R6, R7, R8, R9, R10,
-                R11, R12, R13, R14, R15, R16, R17, R18, R19, R20,
-                R21, R22, R23, R24, R25, R26, R27, R28, R29, R30,
-                R31, R32, R33, R34, R35, R36, R37, R38, R39, R40
-            FROM likert_responses
-        """)
-
-        rows = cur.fetchall()
-        conn.close()
+        total, answered, respondents = cur.execute(
+            _SURVEY_ANALYSIS_SQL
+        ).fetchone()
 
-        if not rows:
+        if not respondents:
             return "No survey data yet"
 
-        # Flatten all responses into a single list
-        scores = []
-        for row in rows:
-            for v in row:
-                if v is not None:
-                    scores.append(int(v))
-
-        if not scores:
+        if not answered:
             return "No valid responses yet"
 
-        mean = round(statistics.mean(scores), 2)
+        mean = round(total / answered, 2)
 
         if mean >= 4.5:
             insight = "Strongly positive perception"
@@ -511,8 +650,8 @@ def survey_analysis():
             insight = "Negative perception"
 
         return (
-            f"Survey Count (Respondents): {len(rows)}\n"
-            f"Total Responses: {len(scores)}\n"
+            f"Survey Count (Respondents): {respondents}\n"
+            f"Total Responses: {answered}\n"
             f"Overall Mean Score: {mean}\n"
             f"Insight: {insight}\n"
         )
@@ -527,43 +666,55 @@ def survey_analysis():
 @login_required
 @role_required("admin")   # ✅ admin only
 def export_survey():
-    try:
-        conn = survey_db()
-        cur = conn.cursor()
-
-        # Explicit column order (important for Excel / SPSS / ML)
-        cur.execute("""
-            SELECT
-                id,
-                R1, R2, R3, R4, R5, R6, R7, R8, R9, R10,
-                R11, R12, R13, R14, R15, R16, R17, R18, R19, R20,
-                R21, R22, R23, R24, R25, R26, R27, R28, R29, R30,
-                R31, R32, R33, R34, R35, R36, R37, R38, R39, R40,
-                role,
-                created_at
-            FROM likert_responses
-            ORDER BY id ASC
-        """)
-
-        rows = cur.fetchall()
-        conn.close()
-
-        import csv
-        with open(EXPORT_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
+    """
+    Streams the CSV in batches: constant memory, nothing written to disk.
+    """
+    def generate():
+        cur = survey_db().cursor()
+        try:
+            # Explicit column order (important for Excel / SPSS / ML)
+            cur.execute("""
+                SELECT
+                    id,
+                    R1, R2, R3, R4, R5, R6, R7, R8, R9, R10,
+                    R11, R12, R13, R14, R15, R16, R17, R18, R19, R20,
+                    R21, R22, R23, R24, R25, R26, R27, R28, R29, R30,
+                    R31, R32, R33, R34, R35, R36, R37, R38, R39, R40,
+                    role,
+                    created_at
+                FROM likert_responses
+                ORDER BY id ASC
+            """)
+
+            buf = io.StringIO()
+            writer = csv.writer(buf)
             writer.writerow([
                 "id",
                 *[f"R{i}" for i in range(1, 41)],
                 "role",
                 "created_at"
             ])
-            for row in rows:
-                writer.writerow(row)
-
-        return send_file(EXPORT_CSV, as_attachment=True)
 
-    except Exception as e:
-        return f"Export error: {e}", 500
+            for batch in iter(lambda: cur.fetchmany(1000), []):
+                writer.writerows(batch)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+            # header only (empty table)
+            if buf.tell():
+                yield buf.getvalue()
+
+        finally:
+            cur.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition": "attachment; filename=survey_dataset.csv"
+        }
+    )
 
 # =============================
 # ADMIN USER MANAGEMENT
@@ -574,16 +725,28 @@ def export_survey():
 def admin_users():
     conn = user_db()
     cur = conn.cursor()
+
+    # Page depends on the user set and on who is viewing it
+    # (by numeric id: usernames may hold quotes or non-latin-1 text,
+    # which are not valid in a header); pending flash messages must
+    # always be rendered.
+    cur.execute("SELECT MAX(id), COUNT(*) FROM users")
+    max_id, count = cur.fetchone()
+    etag = f"users-{max_id}-{count}-{session.get('user_id')}"
+    if "_flashes" not in session:
+        cached = _not_modified(etag)
+        if cached is not None:
+            return cached
+
     cur.execute("SELECT id, username, role, created_at FROM users ORDER BY role, username")
     users = cur.fetchall()
-    conn.close()
 
-    return render_template(
+    return _with_etag(render_template(
         "admin_users.html",
         users=users,
         username=session.get("username"),
         role=session.get("role")
-    )
+    ), etag)
 
 
 @app.post("/admin/users/create")
@@ -601,12 +764,11 @@ def admin_create_user():
     try:
         conn = user_db()
         cur = conn.cursor()
-        cur.execute("""
+        cur.execute(f"""
             INSERT INTO users (username, password_hash, role, created_at)
-            VALUES (?, ?, ?, ?)
-        """, (username, generate_password_hash(password), role, datetime.utcnow().isoformat()))
+            VALUES (?, ?, ?, {SQL_NOW})
+        """, (username, hash_password(password), role))
         conn.commit()
-        conn.close()
         flash(f"User '{username}' created as {role}.", "success")
     except sqlite3.IntegrityError:
         flash("Username already exists", "error")
@@ -629,7 +791,6 @@ def admin_delete_user(user_id):
         cur = conn.cursor()
         cur.execute("DELETE FROM users WHERE id=?", (user_id,))
         conn.commit()
-        conn.close()
         flash("User deleted successfully", "success")
     except Exception as e:
         flash(f"Error deleting user: {e}", "error")
@@ -651,19 +812,12 @@ def change_password():
             return redirect(url_for("change_password"))
 
         user = get_user_by_id(session["user_id"])
-        if not user or not check_password_hash(user["password_hash"], old):
+        if not user or not verify_password(user["password_hash"], old)[0]:
             flash("Old password incorrect", "error")
             return redirect(url_for("change_password"))
 
         try:
-            conn = user_db()
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE users SET password_hash=? WHERE id=?",
-                (generate_password_hash(new), session["user_id"])
-            )
-            conn.commit()
-            conn.close()
+            set_password_hash(session["user_id"], hash_password(new))
             flash("Password updated successfully", "success")
             return redirect(url_for("home"))
         except Exception as e:
@@ -675,43 +829,76 @@ def change_password():
 
 
 
+# Respondent count, cached per process: COUNT(*) is a full scan.
+# Responses are never deleted, so submit_survey just bumps it.
+_survey_total = None
+_survey_total_lock = threading.Lock()
+
+def _survey_count(cur):
+    global _survey_total
+    with _survey_total_lock:
+        if _survey_total is None:
+            cur.execute("SELECT COUNT(*) FROM likert_responses")
+            _survey_total = cur.fetchone()[0]
+        return _survey_total
+
+def _bump_survey_count():
+    global _survey_total
+    with _survey_total_lock:
+        if _survey_total is not None:
+            _survey_total += 1
+
+_RESPONSES_SELECT = """
+    SELECT
+        id,
+        R1, R2, R3, R4, R5,
+        R6, R7, R8, R9, R10,
+        role,
+        created_at
+    FROM likert_responses
+"""
+
 @app.get("/api/survey/responses")
 @login_required
 @role_required("admin")
 def survey_responses():
-    page = int(request.args.get("page", 1))
+    """
+    Keyset pagination: pass the previous page's next_before_id as
+    ?before_id= (an index seek, however deep the page).
+    """
+    before_id = request.args.get("before_id", type=int)
     per_page = 10
-    offset = (page - 1) * per_page
 
     conn = survey_db()
     cur = conn.cursor()
 
-    # total count
-    cur.execute("SELECT COUNT(*) FROM likert_responses")
-    total = cur.fetchone()[0]
-
-    # paginated data
-    cur.execute(f"""
-        SELECT
-            id,
-            R1, R2, R3, R4, R5,
-            R6, R7, R8, R9, R10,
-            role,
-            created_at
-        FROM likert_responses
-        ORDER BY id DESC
-        LIMIT ? OFFSET ?
-    """, (per_page, offset))
+    total = _survey_count(cur)
+
+    # one extra row tells us whether another page exists
+    if before_id is None:
+        cur.execute(
+            _RESPONSES_SELECT + " ORDER BY id DESC LIMIT ?",
+            (per_page + 1,)
+        )
+    else:
+        cur.execute(
+            _RESPONSES_SELECT + " WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id, per_page + 1)
+        )
 
     rows = cur.fetchall()
-    conn.close()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
 
+    # ⚡ Columnar payload: column names once, rows as plain tuples
+    # (no row_factory), serialised by app.json (orjson)
     return {
-        "page": page,
         "per_page": per_page,
         "total": total,
         "pages": (total + per_page - 1) // per_page,
-        "data": rows
+        "next_before_id": rows[-1][0] if has_more else None,
+        "cols": [d[0] for d in cur.description],
+        "rows": rows
     }
 
 
@@ -728,15 +915,11 @@ def survey_responses():
 # =============================
 # ENTRY POINT
 # =============================
-# if __name__ == "__main__":
-#     init_users_db()
-#     init_survey_db()
-#     app.run(host="127.0.0.1", port=5000, debug=True,use_reloader=False)
-init_users_db()
-init_survey_db()
-
-# if __name__ == "__main__":
-#     app.run(debug=True)
+_ensure_schema()
+
+if EMBED_WARMUP:
+    # In the background so startup (and health checks) aren't held up
+    threading.Thread(target=warm_up, daemon=True).start()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
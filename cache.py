@@ -0,0 +1,49 @@
+import re
+import hashlib
+
+import diskcache
+
+from config import CACHE_DIR, CACHE_SIZE_LIMIT
+
+# =========================================================
+# EXACT-MATCH RESPONSE CACHE (L1)
+# Checked before the semantic cache: a hash lookup costs ~1ms,
+# an LLM call costs seconds. Disk-backed and LRU-bounded, so
+# it survives restarts without growing forever.
+# =========================================================
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _WS_RE.sub(" ", text.lower().strip())
+
+
+def make_key(*parts: str, raw=()) -> str:
+    """
+    SHA-256 over the normalised parts, e.g. make_key("chat", role, msg).
+    `raw` texts are hashed verbatim: case and layout can change their
+    meaning (rubric tables, lesson plans), so they must match exactly.
+    """
+    joined = "\x1f".join(
+        [normalize(str(p)) for p in parts] + [str(r) for r in raw]
+    )
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+
+_cache = diskcache.Cache(
+    CACHE_DIR,
+    size_limit=CACHE_SIZE_LIMIT,
+    eviction_policy="least-recently-used",
+)
+
+
+def exact_get(key: str):
+    return _cache.get(key)
+
+
+def exact_set(key: str, val: str):
+    _cache.set(key, val)
+
+
+def clear():
+    _cache.clear()
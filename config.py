@@ -21,7 +21,11 @@ UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 STORAGE_DIR = os.path.join(BASE_DIR, "storage")
 FAISS_INDEX_PATH = os.path.join(STORAGE_DIR, "faiss.index")
 CHUNKS_PATH = os.path.join(STORAGE_DIR, "chunks.jsonl")
+CHUNK_OFFSETS_PATH = CHUNKS_PATH + ".idx"  # int64 byte offset per chunk line
+EMBEDDINGS_PATH = os.path.join(STORAGE_DIR, "embeddings.f32")  # int64 dim + float32 rows
+EMBEDDING_HASHES_PATH = os.path.join(STORAGE_DIR, "embedding_hashes.bin")  # 16 bytes per row
 SQLITE_PATH = os.path.join(STORAGE_DIR, "app.sqlite3")
+CACHE_DIR = os.path.join(STORAGE_DIR, "cache")
 
 os.makedirs(KB_DIR, exist_ok=True)
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -50,6 +54,15 @@ if LLM_BACKEND == "api":
             "LLM_BACKEND=api but LOCAL_LLM_API_KEY or LOCAL_LLM_BASE_URL is missing"
         )
 
+# Ask the server (llama.cpp "cache_prompt") to keep the KV state of the
+# previous prompt and only prefill the new suffix. Our system prompts are
+# fixed strings, so the whole system prefix is reused between requests.
+LLM_CACHE_PROMPT = os.getenv("LLM_CACHE_PROMPT", "1").strip() == "1"
+
+# Max LLM requests in flight from this process; match the server's
+# parallel slot count (llama-server --parallel)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
 # =========================================================
 # EMBEDDED GGUF CONFIG (LEGACY / OPTIONAL)
 # =========================================================
@@ -77,8 +90,47 @@ EMBED_MODEL_NAME = os.getenv(
     "sentence-transformers/all-MiniLM-L6-v2"
 )
 
+# int8 ONNX export of the embedder (see embeddings.py); used when the
+# file exists and onnxruntime is installed, else SentenceTransformer
+EMBED_ONNX_PATH = os.getenv(
+    "EMBED_ONNX_PATH",
+    os.path.join(BASE_DIR, "onnx_minilm", "model_int8.onnx")
+)
+
 TOP_K = int(os.getenv("TOP_K", "5"))
 
+# CPU threads for the embedder (torch or ONNX Runtime); kept to the
+# same budget as FAISS so the two don't oversubscribe the cores
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "4"))
+
+# Load the embedder and run one encode in the background at startup,
+# so the first search doesn't pay the model load
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "1").strip() == "1"
+
+# FAISS (OpenMP) threads. libgomp only reads OMP_NUM_THREADS when
+# faiss is first imported, so it's set here, before rag loads;
+# unset, OpenMP spawns one thread per core per calling thread.
+FAISS_NUM_THREADS = int(os.getenv("FAISS_NUM_THREADS", "4"))
+os.environ.setdefault("OMP_NUM_THREADS", str(FAISS_NUM_THREADS))
+
+# =========================================================
+# EXACT-MATCH RESPONSE CACHE (L1)
+# =========================================================
+# Disk budget; least-recently-used replies are evicted past it
+CACHE_SIZE_LIMIT = int(os.getenv("CACHE_SIZE_LIMIT", str(2 ** 30)))
+
+# =========================================================
+# SEMANTIC RESPONSE CACHE
+# =========================================================
+# Cosine similarity a new question must reach to reuse a cached reply
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+
+# Max cached replies per (role, intent) scope before LRU eviction
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+# Switch large scopes to an HNSW graph (0 = always brute-force scan)
+SEMANTIC_CACHE_HNSW = os.getenv("SEMANTIC_CACHE_HNSW", "1").strip() == "1"
+
 # =========================================================
 # GOVERNANCE / HUMAN-IN-THE-LOOP
 # =========================================================
@@ -94,6 +146,10 @@ print("LLM_BACKEND =", LLM_BACKEND)
 print("MOCK_LLM =", MOCK_LLM)
 print("LOCAL_LLM_BASE_URL =", LOCAL_LLM_BASE_URL if LLM_BACKEND == "api" else "N/A")
 print("GGUF_MODEL_PATH =", GGUF_MODEL_PATH if LLM_BACKEND == "local_gguf" else "N/A")
+print("LLM_CACHE_PROMPT =", LLM_CACHE_PROMPT if LLM_BACKEND == "api" else "N/A")
+print("LLM_MAX_CONCURRENCY =", LLM_MAX_CONCURRENCY)
 print("TOP_K =", TOP_K)
+print("FAISS_NUM_THREADS =", FAISS_NUM_THREADS)
+print("EMBED_NUM_THREADS =", EMBED_NUM_THREADS)
 print("REQUIRE_LECTURER_REVIEW =", REQUIRE_LECTURER_REVIEW)
 print("===================================")
@@ -1,14 +1,94 @@
 import os
+import queue
+import atexit
 import sqlite3
-from datetime import datetime
+import threading
+import itertools
 from config import SQLITE_PATH, STORAGE_DIR
 
+# Current UTC time formatted by SQLite, in the same ISO-8601 shape
+# the app has always stored (naive UTC, fractional seconds)
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+# WAL lets readers run alongside a writer; synchronous=NORMAL is
+# durable in WAL mode without an fsync on every commit.
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=30000000000;
+PRAGMA cache_size=-64000;
+PRAGMA busy_timeout=5000;
+PRAGMA wal_autocheckpoint=1000;
+"""
+
+def open_db(path: str):
+    """
+    Shared SQLite opener for every database in the app (autocommit,
+    tuned pragmas).
+    """
+    con = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    con.executescript(_PRAGMAS)
+    return con
+
+# =============================
+# THREAD-LOCAL CONNECTION POOL
+# One connection per (thread, database file), reused across
+# requests; callers must not close it.
+# =============================
+_tls = threading.local()
+
+# Run PRAGMA optimize every N requests across the whole process
+# (on the connections of whichever thread serves the Nth one)
+OPTIMIZE_EVERY = 500
+_requests = itertools.count(1)  # next() is atomic under the GIL
+
+def get_conn(path: str):
+    conns = getattr(_tls, "conns", None)
+    if conns is None:
+        conns = _tls.conns = {}
+
+    con = conns.get(path)
+    if con is None:
+        con = conns[path] = open_db(path)
+    return con
+
+def maybe_optimize():
+    if next(_requests) % OPTIMIZE_EVERY:
+        return
+    for con in getattr(_tls, "conns", {}).values():
+        con.execute("PRAGMA optimize")
+
 def _connect():
-    os.makedirs(STORAGE_DIR, exist_ok=True)
-    return sqlite3.connect(SQLITE_PATH)
+    return get_conn(SQLITE_PATH)
+
+def refresh_stats(con):
+    """
+    Sampled ANALYZE (cheap even on large tables) so the query
+    planner picks indexes from real row counts. Run at startup.
+    """
+    con.execute("PRAGMA analysis_limit=1000")
+    con.execute("ANALYZE")
+
+# =============================
+# SCHEMA VERSIONING
+# PRAGMA user_version records the schema a file was initialised
+# with, so startup skips DDL when it's already current.
+# =============================
+SCHEMA_VERSION = 1
+
+def schema_version(con) -> int:
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def set_schema_version(con, version: int):
+    con.execute(f"PRAGMA user_version={int(version)}")
 
 def init_db():
+    os.makedirs(STORAGE_DIR, exist_ok=True)
     con = _connect()
+    if schema_version(con) >= SCHEMA_VERSION:
+        return
+
     cur = con.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS interactions (
@@ -23,26 +103,119 @@ def init_db():
     );
     """)
     con.commit()
-    con.close()
+    refresh_stats(con)
+    set_schema_version(con, SCHEMA_VERSION)
 
-def log_interaction(role: str, action: str, user_input: str, output: str, approved: int = 0, reviewer: str = ""):
+# =============================
+# BACKGROUND LOG WRITER
+# Requests only enqueue; one thread drains the queue and writes
+# each batch in a single transaction.
+# =============================
+LOG_BATCH_MAX = 256
+
+_LOG_INSERT_SQL = f"""
+    INSERT INTO interactions (ts, role, action, input, output, approved, reviewer)
+    VALUES ({SQL_NOW}, ?, ?, ?, ?, ?, ?)
+"""
+
+_log_q = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+_STOP = object()
+
+def _insert_rows(con, rows):
+    con.execute("BEGIN IMMEDIATE")
+    con.executemany(_LOG_INSERT_SQL, rows)
+    con.execute("COMMIT")
+
+def _rollback(con):
+    try:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+    except Exception:
+        pass
+
+def _write_batch(batch):
     con = _connect()
-    cur = con.cursor()
-    cur.execute("""
-        INSERT INTO interactions (ts, role, action, input, output, approved, reviewer)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (datetime.utcnow().isoformat(), role, action, user_input, output, approved, reviewer))
-    con.commit()
-    con.close()
+    try:
+        _insert_rows(con, batch)
+        return
+    except Exception as e:
+        _rollback(con)
+        if len(batch) == 1:
+            print("[DB ERROR] Dropped 1 log row:", str(e))
+            return
+        print("[DB ERROR] Batch insert failed, retrying row by row:", str(e))
+
+    # One bad row must not cost the rest of the batch
+    for row in batch:
+        try:
+            _insert_rows(con, [row])
+        except Exception as e:
+            _rollback(con)
+            print("[DB ERROR] Dropped 1 log row:", str(e))
+
+def _writer_loop():
+    while True:
+        first = _log_q.get()
+        if first is _STOP:
+            return
+
+        batch = [first]
+        stop = False
+        while len(batch) < LOG_BATCH_MAX:
+            try:
+                row = _log_q.get_nowait()
+            except queue.Empty:
+                break
+            if row is _STOP:
+                stop = True
+                break
+            batch.append(row)
+
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            # never let the writer die: later rows would pile up unwritten
+            print("[DB ERROR] Log writer:", str(e))
+        if stop:
+            return
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=_writer_loop, name="log-writer", daemon=True
+            )
+            _writer.start()
+
+@atexit.register
+def flush_logs():
+    """
+    Write out anything still queued (runs at interpreter exit).
+    """
+    if _writer is not None and _writer.is_alive():
+        _log_q.put(_STOP)
+        _writer.join(timeout=10)
+
+def log_interaction(role: str, action: str, user_input: str, output: str, approved: int = 0, reviewer: str = ""):
+    if _writer is None or not _writer.is_alive():
+        _ensure_writer()  # first call, or restart after a crash
+    _log_q.put((role, action, user_input, output, approved, reviewer))
+
+# approvals made by this process (part of logs_version)
+_approvals = 0
 
 def approve_interaction(interaction_id: int, reviewer: str):
+    global _approvals
     con = _connect()
     cur = con.cursor()
     cur.execute("""
         UPDATE interactions SET approved=1, reviewer=? WHERE id=?
     """, (reviewer, interaction_id))
     con.commit()
-    con.close()
+    _approvals += 1
 
 def recent_logs(limit: int = 20):
     con = _connect()
@@ -52,5 +225,14 @@ def recent_logs(limit: int = 20):
         FROM interactions ORDER BY id DESC LIMIT ?
     """, (limit,))
     rows = cur.fetchall()
-    con.close()
     return rows
+
+def logs_version():
+    """
+    Changes whenever the log changes: the newest id covers inserts
+    (O(log n) on the rowid b-tree), the counter covers approvals.
+    """
+    con = _connect()
+    cur = con.cursor()
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM interactions")
+    return f"{cur.fetchone()[0]}.{_approvals}"
@@ -0,0 +1,130 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# ⛑️ Optional: without onnxruntime, rag falls back to SentenceTransformer
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+from config import EMBED_ONNX_PATH, EMBED_NUM_THREADS
+
+# =========================================================
+# ONNX INT8 SENTENCE EMBEDDER
+# Same encode() interface as SentenceTransformer, running an
+# int8-quantized export of the model on ONNX Runtime.
+#
+# One-off export (writes the tokenizer files alongside):
+#   optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 \
+#     --optimize O2 onnx_minilm/
+#   python -c "from onnxruntime.quantization import quantize_dynamic, QuantType; \
+#     quantize_dynamic('onnx_minilm/model.onnx', 'onnx_minilm/model_int8.onnx', \
+#     weight_type=QuantType.QInt8)"
+#
+# On AVX512-VNNI CPUs, `optimum-cli onnxruntime quantize --avx512_vnni`
+# gives an int8 model tuned for those dot products; point
+# EMBED_ONNX_PATH at its output instead.
+# =========================================================
+MAX_SEQ_LENGTH = 256  # SentenceTransformer's limit for MiniLM
+
+
+def onnx_available() -> bool:
+    return ort is not None and os.path.exists(EMBED_ONNX_PATH)
+
+
+class OnnxEmbedder:
+    def __init__(self, model_path: str):
+        from transformers import AutoTokenizer
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = EMBED_NUM_THREADS
+        # Fuse attention/LayerNorm/GELU kernels at load (export-time
+        # --optimize already did most of it; this covers plain exports)
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=opts,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            os.path.dirname(model_path)
+        )
+
+        # Pads the next batch while the current one runs (see encode)
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+        # Fast tokenizers are not safe to call from several threads
+        # ("Already borrowed"); only session.run() runs concurrently
+        self._tokenizer_lock = threading.Lock()
+
+        # Hidden size, so empty input still gives a (0, dim) array
+        dim = self.session.get_outputs()[0].shape[-1]
+        if not isinstance(dim, int):
+            dim = self._run(self._pad(self.tokenizer([""]), [0])).shape[1]
+        self.dim = dim
+
+    def encode(self, texts, batch_size: int = 64, **kwargs) -> np.ndarray:
+        """
+        Mean-pooled float32 embeddings, one row per text, in input
+        order (extra SentenceTransformer kwargs are accepted and ignored).
+
+        Texts are tokenized once, sorted by token length and batched,
+        so each batch is padded only to its own longest sequence.
+        With more than one batch, the next batch is padded on a
+        helper thread while the current one runs (ONNX Runtime
+        releases the GIL).
+        """
+        with self._tokenizer_lock:
+            enc = self.tokenizer(
+                list(texts),
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH
+            )
+        lengths = np.fromiter((len(ids) for ids in enc["input_ids"]), dtype=np.int64)
+        order = np.argsort(lengths, kind="stable")
+
+        out = np.empty((len(order), self.dim), dtype=np.float32)
+        if len(order) <= batch_size:
+            # single batch (e.g. a query): nothing to overlap
+            if len(order):
+                out[order] = self._run(self._pad(enc, order))
+            return out
+
+        pending = self._pool.submit(self._pad, enc, order[:batch_size])
+        for i in range(0, len(order), batch_size):
+            idx = order[i:i + batch_size]
+            batch = pending.result()
+            if i + batch_size < len(order):
+                nxt = order[i + batch_size:i + 2 * batch_size]
+                pending = self._pool.submit(self._pad, enc, nxt)
+
+            out[idx] = self._run(batch)  # back to input order
+
+        return out
+
+    def _pad(self, enc, idx):
+        with self._tokenizer_lock:
+            return self.tokenizer.pad(
+                {k: [enc[k][j] for j in idx] for k in enc.keys()},
+                return_tensors="np"
+            )
+
+    def _run(self, batch) -> np.ndarray:
+        feeds = {
+            k: v.astype(np.int64)
+            for k, v in batch.items()
+            if k in self.input_names
+        }
+
+        hidden = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+
+        # Mean pooling over real tokens only
+        mask = batch["attention_mask"][..., None].astype(np.float32)
+        summed = (hidden * mask).sum(axis=1)
+        counts = np.maximum(mask.sum(axis=1), 1e-9)
+        return (summed / counts).astype(np.float32)
@@ -1,22 +1,18 @@
 import re
 
-GREETING_PATTERNS = [
-    r"^hi$",
-    r"^hello$",
-    r"^hey$",
-    r"^good\s+(morning|afternoon|evening)$",
-]
+# One precompiled alternation: a single regex-engine pass per call
+_GREETING_RE = re.compile(r"^(?:hi|hello|hey|good\s+(?:morning|afternoon|evening))$")
 
 def detect_intent(text: str) -> str:
     t = text.lower().strip()
 
     # Greeting
-    for p in GREETING_PATTERNS:
-        if re.match(p, t):
-            return "greeting"
+    if _GREETING_RE.match(t):
+        return "greeting"
 
     # Very short → conversational
-    if len(t.split()) <= 3:
+    # (maxsplit=3: never splits more than needed to see a 4th word)
+    if len(t.split(maxsplit=3)) <= 3:
         return "short_chat"
 
     # Default
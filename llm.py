@@ -1,19 +1,53 @@
+import json
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import threading
-from typing import List, Dict
+from functools import lru_cache
+from typing import List, Dict, Iterator
 
 from config import (
     MOCK_LLM,
     LOCAL_LLM_API_KEY,
     LOCAL_LLM_BASE_URL,
+    LLM_CACHE_PROMPT,
+    LLM_MAX_CONCURRENCY,
 )
 
 # =========================================================
-# GLOBAL LLM LOCK (CRITICAL)
-# Ensures only ONE GGUF request runs at a time
+# ERROR REPLIES
+# User-facing failure messages are ErrorReply instances, so
+# callers can tell them apart from real generations (e.g. to
+# avoid caching them) by type, not by text: a real answer may
+# well contain "⚠️" itself.
 # =========================================================
-LLM_LOCK = threading.Lock()
+ERROR_PREFIX = "⚠️"
+
+
+class ErrorReply(str):
+    """
+    A failure message returned/yielded in place of model output.
+    """
+
+
+def _error(msg: str) -> ErrorReply:
+    return ErrorReply(f"{ERROR_PREFIX} {msg}")
+
+
+def has_error(pieces) -> bool:
+    """
+    True if any streamed piece was a failure message (a stream can
+    fail after partial output).
+    """
+    return any(isinstance(p, ErrorReply) for p in pieces)
+
+
+# =========================================================
+# LLM CONCURRENCY LIMIT (CRITICAL)
+# At most LLM_MAX_CONCURRENCY requests in flight, sized to the
+# server's parallel slots; 1 restores strict serialisation.
+# =========================================================
+LLM_SEM = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
 
 # =========================================================
 # DEBUG VISIBILITY
@@ -24,71 +58,165 @@ print("[DEBUG] USING API KEY =", bool(LOCAL_LLM_API_KEY))
 
 
 # =========================================================
-# INTERNAL API CHAT CALL
+# REQUEST BUILDING
 # =========================================================
-def _api_chat(
-    messages: List[Dict[str, str]],
-    temperature: float,
-    max_tokens: int
-) -> str:
-    """
-    Call local OpenAI-compatible GGUF server (SERIALIZED).
-    """
+def _chat_url() -> str:
+    return f"{LOCAL_LLM_BASE_URL.rstrip('/')}/v1/chat/completions"
 
-    if not LOCAL_LLM_API_KEY or not LOCAL_LLM_BASE_URL:
-        return "⚠️ AI service is not configured correctly."
-
-    url = f"{LOCAL_LLM_BASE_URL.rstrip('/')}/v1/chat/completions"
 
-    headers = {
+def _auth_headers() -> Dict[str, str]:
+    return {
         "Authorization": f"Bearer {LOCAL_LLM_API_KEY}",
         "Content-Type": "application/json",
     }
 
+
+# ♻️ One keep-alive session for every call to the LLM server
+# (no TCP/TLS setup per request)
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.headers.update(_auth_headers())
+
+
+def _payload(
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    stream: bool = False
+) -> Dict:
     payload = {
         "model": "gguf-local",
         "messages": messages,
         "temperature": float(temperature),
         "max_tokens": min(int(max_tokens), 120),  # 🔒 HARD SAFE LIMIT
     }
+    if LLM_CACHE_PROMPT:
+        # ♻️ reuse the KV cache for the shared system-prompt prefix
+        payload["cache_prompt"] = True
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt.strip()},
+        {"role": "user", "content": user_prompt.strip()},
+    ]
+
+
+def _mock_reply(system_prompt: str, user_prompt: str) -> str:
+    return (
+        "[MOCK_LLM]\n"
+        "This is a mock response.\n\n"
+        f"System prompt:\n{system_prompt[:120]}...\n\n"
+        f"User prompt:\n{user_prompt[:180]}...\n"
+    )
+
+
+# =========================================================
+# TOKENIZATION
+# Uses the GGUF model's own tokenizer (llama.cpp /tokenize), so
+# prompt budgets are counted in the units the server enforces.
+# =========================================================
+CHARS_PER_TOKEN = 4  # fallback estimate (mock mode / server down)
+
+# Counting is only an estimate aid: a slow or missing /tokenize
+# (non-llama.cpp servers) must not hold up generation. After a
+# failure, count_tokens() estimates for TOKENIZE_RETRY_AFTER seconds.
+TOKENIZE_TIMEOUT = 2
+TOKENIZE_RETRY_AFTER = 300
+
+_tokenize_down_until = 0.0
+
+
+@lru_cache(maxsize=2048)
+def _server_tokenize(text: str) -> tuple:
+    resp = _SESSION.post(
+        f"{LOCAL_LLM_BASE_URL.rstrip('/')}/tokenize",
+        json={"content": text},
+        timeout=TOKENIZE_TIMEOUT,
+    )
+    resp.raise_for_status()
+    return tuple(resp.json()["tokens"])
+
+
+def count_tokens(text: str) -> int:
+    global _tokenize_down_until
+
+    if (
+        not MOCK_LLM
+        and LOCAL_LLM_BASE_URL
+        and time.monotonic() >= _tokenize_down_until
+    ):
+        try:
+            return len(_server_tokenize(text))
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            _tokenize_down_until = time.monotonic() + TOKENIZE_RETRY_AFTER
+            print(
+                f"[LLM ERROR] Tokenize failed, estimating for "
+                f"{TOKENIZE_RETRY_AFTER}s:", str(e)
+            )
+
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+# =========================================================
+# INTERNAL API CHAT CALL
+# =========================================================
+def _api_chat(
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> str:
+    """
+    Call local OpenAI-compatible GGUF server (SERIALIZED).
+    """
+
+    if not LOCAL_LLM_API_KEY or not LOCAL_LLM_BASE_URL:
+        return _error("AI service is not configured correctly.")
 
-    print("[LLM] Waiting for lock...")
+    url = _chat_url()
+    payload = _payload(messages, temperature, max_tokens)
 
-    # 🔒 SERIALIZE REQUESTS
-    with LLM_LOCK:
-        print("[LLM] Lock acquired")
+    print("[LLM] Waiting for a free slot...")
+
+    # 🔒 BOUNDED CONCURRENCY
+    with LLM_SEM:
+        print("[LLM] Slot acquired")
         print("[LLM] Sending request to:", url)
         print("[LLM] max_tokens =", payload["max_tokens"])
 
         start = time.time()
 
         try:
-            resp = requests.post(
+            resp = _SESSION.post(
                 url,
                 json=payload,
-                headers=headers,
                 timeout=300,  # ⏱️ Render-safe (5 minutes)
             )
             resp.raise_for_status()
 
         except requests.exceptions.Timeout:
             print("[LLM ERROR] Timeout")
-            return "⚠️ The AI is busy. Please wait a moment and try again."
+            return _error("The AI is busy. Please wait a moment and try again.")
 
         except requests.exceptions.RequestException as e:
             print("[LLM ERROR]", str(e))
-            return "⚠️ The AI service is currently busy. Please try again shortly."
+            return _error("The AI service is currently busy. Please try again shortly.")
 
         elapsed = round(time.time() - start, 2)
         print("[LLM] Response received in", elapsed, "seconds")
-        print("[LLM] Lock released")
+        print("[LLM] Slot released")
 
     try:
         data = resp.json()
         return data["choices"][0]["message"]["content"].strip()
     except (KeyError, IndexError):
         print("[LLM ERROR] Invalid response:", resp.text)
-        return "⚠️ AI returned an invalid response."
+        return _error("AI returned an invalid response.")
 
 
 # =========================================================
@@ -104,21 +232,109 @@ def generate(
     Unified generation entry point for the app.
     """
 
+    # 🔹 No response cache here: agents.py already answers repeats from
+    #    the exact-match (L1) and semantic (L2) caches before calling us
     if MOCK_LLM:
-        return (
-            "[MOCK_LLM]\n"
-            "This is a mock response.\n\n"
-            f"System prompt:\n{system_prompt[:120]}...\n\n"
-            f"User prompt:\n{user_prompt[:180]}...\n"
-        )
-
-    messages = [
-        {"role": "system", "content": system_prompt.strip()},
-        {"role": "user", "content": user_prompt.strip()},
-    ]
+        return _mock_reply(system_prompt, user_prompt)
 
     return _api_chat(
-        messages=messages,
+        messages=_messages(system_prompt, user_prompt),
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+
+
+# =========================================================
+# STREAMING API CHAT CALL
+# =========================================================
+def _api_chat_stream(
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> Iterator[str]:
+    """
+    Same as _api_chat, but yields content deltas as the server
+    decodes them (OpenAI-style SSE, "stream": true).
+    """
+
+    if not LOCAL_LLM_API_KEY or not LOCAL_LLM_BASE_URL:
+        yield _error("AI service is not configured correctly.")
+        return
+
+    url = _chat_url()
+    payload = _payload(messages, temperature, max_tokens, stream=True)
+
+    print("[LLM] Waiting for a free slot...")
+
+    # 🔒 BOUNDED CONCURRENCY (slot held until the stream is drained)
+    with LLM_SEM:
+        print("[LLM] Slot acquired (stream)")
+        start = time.time()
+
+        try:
+            resp = _SESSION.post(
+                url,
+                json=payload,
+                timeout=300,
+                stream=True,
+            )
+            resp.raise_for_status()
+
+        except requests.exceptions.Timeout:
+            print("[LLM ERROR] Timeout")
+            yield _error("The AI is busy. Please wait a moment and try again.")
+            return
+
+        except requests.exceptions.RequestException as e:
+            print("[LLM ERROR]", str(e))
+            yield _error("The AI service is currently busy. Please try again shortly.")
+            return
+
+        try:
+            for raw in resp.iter_lines():
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line.startswith("data:"):
+                    continue
+
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+
+                try:
+                    delta = json.loads(data)["choices"][0]["delta"].get("content")
+                except (ValueError, KeyError, IndexError):
+                    continue
+
+                if delta:
+                    yield delta
+
+        except requests.exceptions.RequestException as e:
+            print("[LLM ERROR] Stream interrupted:", str(e))
+            yield ErrorReply("\n\n" + _error("The AI stream was interrupted. Please try again."))
+
+        finally:
+            resp.close()
+            elapsed = round(time.time() - start, 2)
+            print("[LLM] Stream finished in", elapsed, "seconds")
+            print("[LLM] Slot released")
+
+
+def generate_stream(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float = 0.6,
+    max_tokens: int = 120,
+) -> Iterator[str]:
+    """
+    Streaming twin of generate(): yields text as it is produced.
+    """
+
+    if MOCK_LLM:
+        yield _mock_reply(system_prompt, user_prompt)
+        return
+
+    yield from _api_chat_stream(
+        messages=_messages(system_prompt, user_prompt),
         temperature=temperature,
         max_tokens=max_tokens,
     )
@@ -1,21 +1,40 @@
 import os
-import json
-import numpy as np
-import faiss
+import hashlib
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from types import MappingProxyType
 
-from sentence_transformers import SentenceTransformer
+# config first: it sets OMP_NUM_THREADS before faiss loads OpenMP
 from config import (
     EMBED_MODEL_NAME,
+    EMBED_ONNX_PATH,
+    EMBED_NUM_THREADS,
     TOP_K,
     FAISS_INDEX_PATH,
+    FAISS_NUM_THREADS,
     CHUNKS_PATH,
+    CHUNK_OFFSETS_PATH,
+    EMBEDDINGS_PATH,
+    EMBEDDING_HASHES_PATH,
     STORAGE_DIR
 )
 
+import numpy as np
+import faiss
+import orjson
+
+from sentence_transformers import SentenceTransformer
+from cache import normalize
+from embeddings import OnnxEmbedder, onnx_available
+
+faiss.omp_set_num_threads(FAISS_NUM_THREADS)
+
 # =========================================================
 # GLOBALS (lazy-loaded)
 # =========================================================
 _embedder = None
+_embedder_lock = threading.Lock()
 
 
 # =========================================================
@@ -24,41 +43,248 @@ _embedder = None
 def _get_embedder():
     global _embedder
     if _embedder is None:
-        _embedder = SentenceTransformer(
-            EMBED_MODEL_NAME,
-            device="cpu"   # force CPU (important for stability)
-        )
+        # One load per process, even if the warm-up thread and a
+        # request get here together (the loser waits, then reuses it)
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = _load_embedder()
     return _embedder
 
 
+def _load_embedder():
+    if onnx_available():
+        # ⚡ int8 ONNX Runtime: near-identical vectors, ~2-4x faster on CPU
+        print("[RAG] Embedder: ONNX int8", EMBED_ONNX_PATH)
+        return OnnxEmbedder(EMBED_ONNX_PATH)
+
+    import torch
+    torch.set_num_threads(EMBED_NUM_THREADS)
+
+    return SentenceTransformer(
+        EMBED_MODEL_NAME,
+        device="cpu"   # force CPU (important for stability)
+    )
+
+
+def warm_up():
+    """
+    Load the embedder and run one encode (tokenizer + first-call
+    allocations), so the first real query is served at full speed.
+    """
+    try:
+        _get_embedder().encode(["warmup"], show_progress_bar=False)
+        print("[RAG] Embedder warm")
+    except Exception as e:
+        print("[RAG] Warm-up failed:", str(e))
+
+
 # =========================================================
 # VECTOR NORMALISATION
 # =========================================================
 def _normalize(v: np.ndarray) -> np.ndarray:
-    norm = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
-    return v / norm
+    # In place, in C (no temporaries); zero rows stay zero.
+    # Copies only when `v` isn't already C-contiguous float32.
+    v = np.ascontiguousarray(v, dtype=np.float32)
+    faiss.normalize_L2(v)
+    return v
+
+
+# =========================================================
+# QUERY EMBEDDING (shared by RAG search + semantic cache)
+# =========================================================
+# One lock per query being encoded: concurrent asks for the same
+# query wait for the first encode and then hit the memo, while
+# different queries encode in parallel.
+_embed_locks = {}
+_embed_locks_guard = threading.Lock()
+
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Encode + normalise a single query as a (1, dim) float32 array.
+    Memoised so one chat turn only pays for one encode, even when
+    the semantic cache and RAG search ask for it concurrently.
+    """
+    with _embed_locks_guard:
+        lock = _embed_locks.setdefault(query, threading.Lock())
+
+    try:
+        with lock:
+            return _embed_query(query)
+    finally:
+        with _embed_locks_guard:
+            if _embed_locks.get(query) is lock:
+                del _embed_locks[query]
+
+
+@lru_cache(maxsize=256)
+def _embed_query(query: str) -> np.ndarray:
+    q = _get_embedder().encode(
+        [query],
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+
+    q = _normalize(q)  # casts only if the encoder didn't give float32
+    q.flags.writeable = False  # shared via the memo, never mutate
+    return q
 
 
 # =========================================================
 # STORAGE HELPERS
 # =========================================================
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def _atomic_path(path: str):
+    """
+    Yields a temp path to write; on success it is fsynced and
+    renamed over `path`, so readers see the old file or the new
+    one, never a partial write (and existing mmaps stay valid).
+    """
+    tmp = path + ".tmp"
+    yield tmp
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
 def load_chunks():
     if not os.path.exists(CHUNKS_PATH):
         return []
 
+    # One read + orjson per line (C parser, straight from bytes)
+    with open(CHUNKS_PATH, "rb") as f:
+        data = f.read()
+
     chunks = []
-    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-        for line in f:
-            chunks.append(json.loads(line))
+    for line in data.splitlines():
+        if not line:
+            continue
+        try:
+            chunks.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            # torn last line from an interrupted write: skip it
+            print("[RAG] Skipping unreadable chunk line")
     return chunks
 
 
-def save_chunks(chunks):
+def save_chunks(chunks, append: bool = False):
+    """
+    Write chunks as JSON lines (and their offsets to the .idx
+    sidecar). append=True adds to the existing file instead of
+    rewriting it.
+    """
     os.makedirs(STORAGE_DIR, exist_ok=True)
 
-    with open(CHUNKS_PATH, "w", encoding="utf-8") as f:
-        for c in chunks:
-            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    lines = [orjson.dumps(c, option=orjson.OPT_APPEND_NEWLINE) for c in chunks]
+
+    if not (append and os.path.exists(CHUNKS_PATH)):
+        with _atomic_path(CHUNKS_PATH) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(b"".join(lines))
+        with _atomic_path(CHUNK_OFFSETS_PATH) as tmp:
+            _offsets_from(0, lines).tofile(tmp)
+        return
+
+    # Only extend the sidecar if it matches the file so far;
+    # otherwise the next ingest rebuilds it from scratch
+    idx_size = _file_size(CHUNK_OFFSETS_PATH) if _offsets_in_sync() else None
+
+    with open(CHUNKS_PATH, "ab+") as f:
+        end = f.tell()
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                # torn last line: end it so it stays a lone bad line
+                f.write(b"\n")
+                end += 1
+        f.write(b"".join(lines))
+        f.flush()
+        os.fsync(f.fileno())  # an interrupted append tears one line at most
+
+    # Re-check right before appending: if the sidecar changed under
+    # us, leave it stale rather than risk duplicate offsets
+    if idx_size is not None and _file_size(CHUNK_OFFSETS_PATH) == idx_size:
+        with open(CHUNK_OFFSETS_PATH, "ab") as f:
+            f.write(_offsets_from(end, lines).tobytes())
+
+
+def _offsets_from(pos: int, lines) -> np.ndarray:
+    offsets = np.full(len(lines), pos, dtype=np.int64)
+    if lines:
+        offsets[1:] += np.cumsum([len(l) for l in lines[:-1]], dtype=np.int64)
+    return offsets
+
+
+# =========================================================
+# RANDOM ACCESS BY CHUNK NUMBER
+# The .idx sidecar holds each line's byte offset, so a search
+# reads only its top_k lines instead of parsing the whole file.
+# =========================================================
+def _offsets_in_sync() -> bool:
+    return (
+        os.path.exists(CHUNK_OFFSETS_PATH)
+        and _mtime_ns(CHUNK_OFFSETS_PATH) >= _mtime_ns(CHUNKS_PATH)
+    )
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return -1
+
+
+def _chunk_count() -> int:
+    # O(1): one int64 per chunk in the sidecar
+    if _offsets_in_sync():
+        return os.path.getsize(CHUNK_OFFSETS_PATH) // 8
+    return len(_load_offsets(persist=True))
+
+
+def _load_offsets(persist: bool = False) -> np.ndarray:
+    """
+    Byte offset of every readable chunk line. Only writers
+    (ingest) pass persist=True: a search must never rewrite the
+    sidecar, or it could race an ingest's append to it.
+    """
+    if _offsets_in_sync():
+        return np.fromfile(CHUNK_OFFSETS_PATH, dtype=np.int64)
+
+    # Missing or older than the data: rebuild with one scan,
+    # keeping exactly the lines load_chunks() would keep
+    offsets = []
+    if os.path.exists(CHUNKS_PATH):
+        pos = 0
+        with open(CHUNKS_PATH, "rb") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        orjson.loads(line)
+                        offsets.append(pos)
+                    except orjson.JSONDecodeError:
+                        pass
+                pos += len(line)
+
+    offsets = np.array(offsets, dtype=np.int64)
+    if persist:
+        with _atomic_path(CHUNK_OFFSETS_PATH) as tmp:
+            offsets.tofile(tmp)
+    return offsets
+
+
+@lru_cache(maxsize=4096)
+def _read_chunk(offset: int, version) -> dict:
+    # `version` only keys the memo to the current file contents
+    with open(CHUNKS_PATH, "rb") as f:
+        f.seek(offset)
+        return orjson.loads(f.readline())
 
 
 # =========================================================
@@ -76,11 +302,14 @@ def chunk_text(
     - Prevents runaway memory usage
     - No overlap (overlap caused MemoryError before)
     - Enforces hard size limits
+
+    Returns an iterator of {"source", "text"} dicts; size limits
+    are checked up front.
     """
 
     text = text.strip()
     if not text:
-        return []
+        return iter(())
 
     # HARD SAFETY LIMIT (VERY IMPORTANT)
     MAX_TEXT_LENGTH = 200_000  # ~200 KB text max
@@ -92,30 +321,184 @@ def chunk_text(
             f"Please ingest smaller sections."
         )
 
-    chunks = []
-    start = 0
+    # Checked above, chunks produced lazily below
+    return _iter_chunks(text, source, chunk_size, max_chunks)
+
+
+def _iter_chunks(text: str, source: str, chunk_size: int, max_chunks: int):
     text_len = len(text)
 
-    while start < text_len and len(chunks) < max_chunks:
+    # 🔹 Plain str slices on purpose: every chunk must become a str
+    #    anyway (chunk dict, orjson line, tokenizer), so a memoryview
+    #    over UTF-8 bytes would only swap the slice for a decode, and
+    #    byte offsets could split multi-byte characters. As a generator
+    #    only one slice is alive at a time.
+    for start in range(0, text_len, chunk_size)[:max_chunks]:
         end = min(text_len, start + chunk_size)
-        chunk = text[start:end]
-
-        chunks.append({
+        yield {
             "source": source,
-            "text": chunk
-        })
+            "text": text[start:end]
+        }
+        # ❗ NO OVERLAP (KEY FIX): next chunk starts at `end`
 
-        start = end  # ❗ NO OVERLAP (KEY FIX)
 
-    return chunks
+# =========================================================
+# FAISS INDEX BUILDING (MEMORY-SAFE)
+# =========================================================
+# Exact flat scan up to this many chunks, HNSW graph beyond.
+# Both store int8 codes (1 byte/dim instead of 4), so the scan
+# reads a quarter of the memory; queries stay float32.
+HNSW_MIN_CHUNKS = 5_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+EMBED_BATCH_SIZE = 64
+ENCODE_BLOCK = 1024  # texts per encode() call (a multiple of the batch size)
+
+
+def _new_index(dim: int, n: int):
+    qtype = faiss.ScalarQuantizer.QT_8bit_uniform
+    if n > HNSW_MIN_CHUNKS:
+        # Sub-linear graph search once a flat scan gets expensive
+        index = faiss.IndexHNSWSQ(dim, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH  # saved with the index
+    else:
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    # Vectors are unit length, so every component lies in [-1, 1]:
+    # the uniform quantizer is "trained" on those bounds, and later
+    # appends never need retraining.
+    bounds = np.vstack([-np.ones(dim), np.ones(dim)]).astype("float32")
+    index.train(bounds)
+    return index
+
+
+def _write_index(index):
+    # Write-then-rename: a reader that mmapped the old file keeps
+    # its (unlinked) pages instead of seeing a truncated file
+    with _atomic_path(FAISS_INDEX_PATH) as tmp:
+        faiss.write_index(index, tmp)
+
+
+def _encode_chunks(chunks) -> np.ndarray:
+    """
+    Normalised (n, dim) float32 embeddings, written block by block
+    into one preallocated matrix.
+    """
+    texts = [c["text"] for c in chunks]
+    embedder = _get_embedder()
+
+    # SentenceTransformer stacks its per-batch outputs, so a single
+    # call over N texts briefly holds two N x dim copies; blocks cap
+    # that extra copy at ENCODE_BLOCK rows. Within a block both
+    # encoders (SentenceTransformer, OnnxEmbedder) still sort by
+    # length and return rows in input order.
+    embs = None
+    for start in range(0, len(texts), ENCODE_BLOCK):
+        block = embedder.encode(
+            texts[start:start + ENCODE_BLOCK],
+            batch_size=EMBED_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        if embs is None:
+            embs = np.empty((len(texts), block.shape[1]), dtype=np.float32)
+        embs[start:start + len(block)] = block  # casts in the copy
+
+    faiss.normalize_L2(embs)  # in place
+    return embs
 
 
 # =========================================================
-# FAISS INDEX BUILDING (MEMORY-SAFE)
+# EMBEDDING CACHE (disk)
+# Normalised vectors saved next to the index, keyed by a hash of
+# (embedder, text), so a full rebuild only encodes unseen text.
+# Raw append-only files (an int64 dim header, then float32 rows;
+# 16-byte hashes alongside), so an ingest appends its rows instead
+# of rewriting the cache, and a load is a memmap.
 # =========================================================
+_HASH_SIZE = 16
+_HEADER = np.dtype(np.int64).itemsize
+
+
+def _embedder_id() -> str:
+    # Model file size + mtime are part of the id, so re-exporting
+    # or re-quantizing at the same path never reuses old vectors
+    path = EMBED_ONNX_PATH if onnx_available() else EMBED_MODEL_NAME
+    try:
+        st = os.stat(path)
+        return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        return path  # a hub model name, not a local path
+
+
+def _text_hashes(chunks) -> np.ndarray:
+    prefix = _embedder_id().encode("utf-8") + b"\0"
+    return np.array(
+        [
+            hashlib.blake2b(prefix + c["text"].encode("utf-8"), digest_size=_HASH_SIZE).digest()
+            for c in chunks
+        ],
+        dtype=f"S{_HASH_SIZE}"
+    )
+
+
+def _embedding_cache_shape():
+    """
+    (rows, dim) of a consistent cache on disk, else None (missing,
+    or torn by an interrupted write).
+    """
+    embs_size = _file_size(EMBEDDINGS_PATH)
+    hashes_size = _file_size(EMBEDDING_HASHES_PATH)
+    if embs_size < _HEADER or hashes_size < 0 or hashes_size % _HASH_SIZE:
+        return None
+
+    with open(EMBEDDINGS_PATH, "rb") as f:
+        dim = int(np.frombuffer(f.read(_HEADER), dtype=np.int64)[0])
+
+    n = hashes_size // _HASH_SIZE
+    if dim <= 0 or embs_size != _HEADER + n * dim * 4:
+        return None
+    return n, dim
+
+
+def _load_embedding_cache():
+    shape = _embedding_cache_shape()
+    if shape is None or not shape[0]:
+        return None, None
+
+    embs = np.memmap(EMBEDDINGS_PATH, dtype=np.float32, mode="r", offset=_HEADER, shape=shape)
+    hashes = np.fromfile(EMBEDDING_HASHES_PATH, dtype=f"S{_HASH_SIZE}")
+    return embs, hashes
+
+
+def _save_embedding_cache(embs: np.ndarray, hashes: np.ndarray):
+    with _atomic_path(EMBEDDINGS_PATH) as tmp:
+        with open(tmp, "wb") as f:
+            f.write(np.int64(embs.shape[1]).tobytes())
+            f.write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+    with _atomic_path(EMBEDDING_HASHES_PATH) as tmp:
+        hashes.tofile(tmp)
+
+
+def _append_embedding_cache(embs: np.ndarray, hashes: np.ndarray, n_before: int):
+    # Only extend a cache that is exactly in step with the index;
+    # otherwise the next full rebuild rewrites it
+    if _embedding_cache_shape() != (n_before, embs.shape[1]):
+        return
+    with open(EMBEDDINGS_PATH, "ab") as f:
+        f.write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+    with open(EMBEDDING_HASHES_PATH, "ab") as f:
+        f.write(hashes.tobytes())
+
+
 def build_index(chunks):
     """
     Builds cosine-similarity FAISS index using normalized embeddings.
+    Full rebuild: only chunks missing from the embedding cache are
+    encoded.
     """
 
     if not chunks:
@@ -123,83 +506,221 @@ def build_index(chunks):
 
     os.makedirs(STORAGE_DIR, exist_ok=True)
 
-    embedder = _get_embedder()
-    texts = [c["text"] for c in chunks]
+    hashes = _text_hashes(chunks)
+    cached_embs, cached_hashes = _load_embedding_cache()
+    row_of = {} if cached_hashes is None else {
+        h: i for i, h in enumerate(cached_hashes.tolist())
+    }
+
+    hits = [(i, row_of[h]) for i, h in enumerate(hashes.tolist()) if h in row_of]
+    missing = [i for i, h in enumerate(hashes.tolist()) if h not in row_of]
+
+    if not hits:
+        # Cold build: encode straight into the final matrix
+        embs = _encode_chunks(chunks)
+    else:
+        new_embs = _encode_chunks([chunks[i] for i in missing]) if missing else None
+
+        embs = np.empty((len(chunks), cached_embs.shape[1]), dtype=np.float32)
+        dst, src = zip(*hits)
+        embs[list(dst)] = cached_embs[list(src)]
+        if missing:
+            embs[missing] = new_embs
+        del new_embs
+    cached_embs = None  # release the memmap before its file is replaced
+
+    print(f"[RAG] Rebuild: {len(hits)} cached, {len(missing)} encoded")
+    _save_embedding_cache(embs, hashes)
+
+    index = _new_index(embs.shape[1], len(embs))
+    index.add(embs)
 
-    # Encode in small batches to avoid RAM spikes
-    BATCH_SIZE = 32
-    embeddings = []
+    _write_index(index)
 
-    for i in range(0, len(texts), BATCH_SIZE):
-        batch = texts[i:i + BATCH_SIZE]
-        embs = embedder.encode(
-            batch,
-            convert_to_numpy=True,
-            show_progress_bar=False
-        )
-        embeddings.append(embs)
 
-    embs = np.vstack(embeddings).astype("float32")
-    embs = _normalize(embs)
+def append_to_index(new_chunks, n_indexed: int) -> bool:
+    """
+    Encodes only `new_chunks` and adds them to the stored index.
+    Returns False (nothing written) if the stored index doesn't hold
+    exactly `n_indexed` vectors, i.e. a full rebuild is needed.
+    """
+    if not os.path.exists(FAISS_INDEX_PATH):
+        return False
+
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    if index.ntotal != n_indexed:
+        return False
+
+    if not new_chunks:
+        return True
+
+    embs = _encode_chunks(new_chunks)
+
+    # Crossing the HNSW threshold: move the stored vectors over
+    # (decoded from the flat index, not re-encoded)
+    total = index.ntotal + len(embs)
+    if not isinstance(index, faiss.IndexHNSW) and total > HNSW_MIN_CHUNKS:
+        old = index.reconstruct_n(0, index.ntotal)
+        index = _new_index(index.d, total)
+        index.add(old)
 
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)
     index.add(embs)
+    _write_index(index)
+
+    # keep the embedding cache in step: O(new rows), no reload
+    _append_embedding_cache(embs, _text_hashes(new_chunks), n_indexed)
+    return True
+
+
+# =========================================================
+# INGEST HOOKS
+# Callbacks run with the source name after every successful
+# ingest (e.g. to drop cached answers that are now stale).
+# =========================================================
+_ingest_hooks = []
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
+
+def on_ingest(fn):
+    _ingest_hooks.append(fn)
+    return fn
 
 
 # =========================================================
 # INGESTION PIPELINE (SAFE + GUARDED)
 # =========================================================
-def ingest_text(text: str, source: str):
-    chunks = load_chunks()
+_ingest_lock = threading.Lock()
 
+
+def ingest_text(text: str, source: str):
     try:
-        new_chunks = chunk_text(text, source=source)
+        new_chunks = list(chunk_text(text, source=source))
     except ValueError as e:
         raise RuntimeError(str(e))
 
-    chunks.extend(new_chunks)
+    # One writer at a time (the sidecar append assumes it)
+    with _ingest_lock:
+        # Chunks already on disk are counted from the offsets
+        # sidecar's size, not parsed
+        n_indexed = _chunk_count()
+
+        save_chunks(new_chunks, append=True)
 
-    save_chunks(chunks)
-    build_index(chunks)
+        # Only the new chunks are encoded; full rebuild if the stored
+        # index is missing or out of step with chunks.jsonl
+        if not append_to_index(new_chunks, n_indexed):
+            build_index(load_chunks())
+    _cached_search.cache_clear()
+
+    for hook in _ingest_hooks:
+        try:
+            hook(source)
+        except Exception as e:
+            print("[INGEST HOOK ERROR]", str(e))
 
     return len(new_chunks)
 
 
+# =========================================================
+# LOADED INDEX + CHUNKS (process-wide)
+# Loaded once and reused by every search; reloaded only when
+# either file changes on disk (e.g. an ingest in another worker).
+# =========================================================
+# Search-side loads are mmapped read-only: pages are faulted in on
+# demand and shared with other workers through the page cache.
+# Zero-copy mapping of the SQ/HNSW codes needs a faiss build with
+# IO_FLAG_MMAP_IFC (requirements.txt pins one); older builds honour
+# IO_FLAG_MMAP for IVF lists only and read everything else into RAM.
+_MMAP_ZERO_COPY = hasattr(faiss, "IO_FLAG_MMAP_IFC")
+_MMAP_FLAGS = (
+    faiss.IO_FLAG_MMAP_IFC if _MMAP_ZERO_COPY else faiss.IO_FLAG_MMAP
+) | faiss.IO_FLAG_READ_ONLY
+
+if not _MMAP_ZERO_COPY:
+    print("[RAG] faiss", faiss.__version__, "has no IO_FLAG_MMAP_IFC: index is read into RAM")
+
+class _Snapshot:
+    """
+    An (index, offsets) pair loaded together for one `version`.
+    Hashes/compares by version only, so it can key the search memo
+    while carrying the exact objects the hits are computed from.
+    """
+    __slots__ = ("index", "offsets", "version")
+
+    def __init__(self, index, offsets, version):
+        self.index, self.offsets, self.version = index, offsets, version
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def __eq__(self, other):
+        return isinstance(other, _Snapshot) and self.version == other.version
+
+
+_store_lock = threading.Lock()
+_store = None  # current _Snapshot, swapped whole under the lock
+
+
+def _get_store() -> _Snapshot:
+    global _store
+    version = (
+        _mtime_ns(FAISS_INDEX_PATH),
+        _mtime_ns(CHUNKS_PATH),
+        _mtime_ns(CHUNK_OFFSETS_PATH)  # a sidecar append lands after the data
+    )
+
+    with _store_lock:
+        if _store is None or _store.version != version:
+            _store = _Snapshot(
+                faiss.read_index(FAISS_INDEX_PATH, _MMAP_FLAGS),
+                _load_offsets(),
+                version
+            )
+            # memoised hits hold the old snapshot: let it go
+            _cached_search.cache_clear()
+        return _store
+
+
 # =========================================================
 # SEARCH (RAG RETRIEVAL)
 # =========================================================
 def search(query: str, top_k: int = TOP_K):
-    chunks = load_chunks()
-
-    if not chunks or not os.path.exists(FAISS_INDEX_PATH):
+    if not os.path.exists(FAISS_INDEX_PATH):
         return []
 
-    index = faiss.read_index(FAISS_INDEX_PATH)
+    # The file versions are part of the key so a rebuild (in any
+    # worker) never serves stale hits.
+    return list(_cached_search(normalize(query), top_k, _get_store()))
 
-    embedder = _get_embedder()
-    q = embedder.encode(
-        [query],
-        convert_to_numpy=True,
-        show_progress_bar=False
-    ).astype("float32")
 
-    q = _normalize(q)
+@lru_cache(maxsize=1024)
+def _cached_search(query_norm: str, top_k: int, snap: _Snapshot):
+    """
+    Hits are read-only mappings so one cached result can be
+    shared safely between requests. Computed against `snap`
+    only, never the (possibly newer) global store.
+    """
+    if not len(snap.offsets):
+        return ()
+
+    q = embed_query(query_norm)
+
+    scores, idxs = snap.index.search(q, top_k)
+    return _hits(scores[0], idxs[0], snap.offsets, snap.version)
 
-    scores, idxs = index.search(q, top_k)
 
+def _hits(scores, idxs, offsets, version) -> tuple:
+    n = len(offsets)
     results = []
-    for score, idx in zip(scores[0], idxs[0]):
-        if idx < 0 or idx >= len(chunks):
+    # Plain Python floats/ints in one go, not a numpy scalar per hit
+    for score, idx in zip(scores.tolist(), idxs.tolist()):
+        if idx < 0 or idx >= n:
             continue
 
-        c = chunks[idx]
-        results.append({
-            "score": float(score),
+        c = _read_chunk(int(offsets[idx]), version)
+        results.append(MappingProxyType({
+            "score": score,
             "source": c.get("source", ""),
             "text": c.get("text", "")
-        })
+        }))
 
-    return results
+    return tuple(results)
@@ -1,14 +1,19 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
-class ChatRequest(BaseModel):
+class _Request(BaseModel):
+    # Request bodies are parsed once and only read: unknown keys are
+    # dropped, and instances are immutable
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+class ChatRequest(_Request):
     message: str = Field(..., min_length=1)
 
-class LessonRequest(BaseModel):
+class LessonRequest(_Request):
     subject: str
     topic: str
     level: str = "College of Education"
     duration_min: int = 40
 
-class FeedbackRequest(BaseModel):
+class FeedbackRequest(_Request):
     lesson_text: str
     rubric_text: str
@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+
+# config first: it sets OMP_NUM_THREADS before faiss loads OpenMP
+from config import (
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_HNSW,
+)
+
+import faiss
+import numpy as np
+
+from cache import normalize
+from rag import embed_query
+
+# =========================================================
+# INDEX TUNING
+# Small stores are a float32 matrix scanned with one BLAS matvec;
+# past HNSW_MIN_ENTRIES a store switches to an int8 HNSW graph
+# (O(log n) lookups, 1 byte/dim instead of 4).
+# =========================================================
+INITIAL_CAPACITY = 64
+
+HNSW_MIN_ENTRIES = 1000
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 40
+
+# HNSW cannot delete: evicted entries stay in the graph as
+# tombstones until they exceed this share of it, then we rebuild.
+MAX_DEAD_FRACTION = 0.25
+
+# Candidates fetched per HNSW lookup, so a tombstone in first
+# place doesn't hide the live entry just behind it.
+SEARCH_K = 4
+
+
+def _new_hnsw_index(dim: int):
+    base = faiss.IndexHNSWSQ(
+        dim,
+        faiss.ScalarQuantizer.QT_8bit_uniform,
+        HNSW_M,
+        faiss.METRIC_INNER_PRODUCT
+    )
+    base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    base.hnsw.efSearch = HNSW_EF_SEARCH
+
+    # Inputs are unit vectors, so every component lies in [-1, 1]:
+    # the uniform int8 quantizer is "trained" on those bounds.
+    bounds = np.vstack([-np.ones(dim), np.ones(dim)]).astype("float32")
+    base.train(bounds)
+    return faiss.IndexIDMap2(base)
+
+
+# =========================================================
+# PER-SCOPE STORE
+# One store per (role, intent) so a lecturer answer is never
+# replayed to a student (and vice versa).
+# =========================================================
+class _Store:
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.replies = OrderedDict()  # id -> reply, oldest first (LRU)
+        self.sources = {}  # id -> RAG sources the reply was built from
+        self.next_id = 0
+
+        self._reset_flat()
+
+    def _reset_flat(self):
+        # Flat tier: rows [0, n) of a C-contiguous float32 matrix
+        self.vecs = np.empty((INITIAL_CAPACITY, self.dim), dtype=np.float32)
+        self.row_ids = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.rows = {}  # id -> row
+        self.n = 0
+
+        # HNSW tier (replaces the matrix once large enough)
+        self.index = None
+
+    def search(self, q):
+        if self.index is not None:
+            k = min(SEARCH_K, self.index.ntotal)
+            scores, ids = self.index.search(q, k)
+            return zip(scores[0].tolist(), ids[0].tolist())
+
+        if self.n == 0:
+            return []
+
+        sims = self.vecs[:self.n] @ q[0]  # SGEMV over all cached queries
+        i = int(sims.argmax())
+        return [(float(sims[i]), int(self.row_ids[i]))]
+
+    def add(self, q, reply: str, sources):
+        _id = self.next_id
+        self.next_id += 1
+        self.replies[_id] = reply
+        self.sources[_id] = frozenset(sources)
+
+        if self.index is not None:
+            self.index.add_with_ids(q, np.array([_id], dtype="int64"))
+            return
+
+        if self.n == len(self.vecs):
+            self._grow()
+
+        self.vecs[self.n] = q[0]
+        self.row_ids[self.n] = _id
+        self.rows[_id] = self.n
+        self.n += 1
+
+        if SEMANTIC_CACHE_HNSW and self.n >= HNSW_MIN_ENTRIES:
+            self._to_hnsw()
+
+    def evict_oldest(self):
+        self.remove(next(iter(self.replies)))
+
+    def remove(self, _id: int):
+        del self.replies[_id]
+        del self.sources[_id]
+
+        if self.index is not None:
+            dead = self.index.ntotal - len(self.replies)
+            if dead > self.index.ntotal * MAX_DEAD_FRACTION:
+                self._rebuild_hnsw()
+            return
+
+        # Swap the last row into the freed one to keep [0, n) dense
+        row = self.rows.pop(_id)
+        last = self.n - 1
+        if row != last:
+            moved = int(self.row_ids[last])
+            self.vecs[row] = self.vecs[last]
+            self.row_ids[row] = moved
+            self.rows[moved] = row
+        self.n -= 1
+
+    def _grow(self):
+        # Doubling keeps appends amortised O(1)
+        cap = 2 * len(self.vecs)
+
+        vecs = np.empty((cap, self.dim), dtype=np.float32)
+        vecs[:self.n] = self.vecs[:self.n]
+        row_ids = np.empty(cap, dtype=np.int64)
+        row_ids[:self.n] = self.row_ids[:self.n]
+
+        self.vecs, self.row_ids = vecs, row_ids
+
+    def _to_hnsw(self):
+        index = _new_hnsw_index(self.dim)
+        index.add_with_ids(self.vecs[:self.n], self.row_ids[:self.n])
+
+        self.index = index
+        self.vecs = self.row_ids = None
+        self.rows = {}
+        self.n = 0
+
+    def _rebuild_hnsw(self):
+        """
+        Re-index the live entries only (drops tombstones).
+        """
+        if not self.replies:
+            # everything was removed: start over as an empty flat tier
+            self._reset_flat()
+            return
+
+        ids = np.fromiter(self.replies.keys(), dtype="int64")
+        vecs = np.vstack([self.index.reconstruct(int(i)) for i in ids])
+
+        index = _new_hnsw_index(self.dim)
+        index.add_with_ids(vecs, ids)
+        self.index = index
+
+
+_stores = {}
+_lock = threading.Lock()
+
+
+# =========================================================
+# LOOKUP
+# =========================================================
+def get(query: str, scope) -> str | None:
+    """
+    Return a cached reply for a semantically equivalent query
+    in the same scope, or None on a miss.
+    """
+    store = _stores.get(scope)
+    if store is None:
+        return None
+
+    q = embed_query(normalize(query))
+
+    with _lock:
+        for score, _id in store.search(q):
+            if score < SEMANTIC_CACHE_THRESHOLD:
+                break  # results are sorted, nothing better follows
+            if _id in store.replies:  # skip HNSW tombstones
+                store.replies.move_to_end(_id)
+                return store.replies[_id]
+
+    return None
+
+
+# =========================================================
+# INSERT (LRU-BOUNDED)
+# =========================================================
+def put(query: str, reply: str, scope, sources=()):
+    """
+    Cache a reply; `sources` are the RAG sources it was built from,
+    used by invalidate().
+    """
+    q = embed_query(normalize(query))
+
+    with _lock:
+        store = _stores.get(scope)
+        if store is None:
+            store = _stores[scope] = _Store(q.shape[1])
+
+        if len(store.replies) >= SEMANTIC_CACHE_MAX_ENTRIES:
+            store.evict_oldest()
+
+        store.add(q, reply, sources)
+
+
+# =========================================================
+# INVALIDATION (knowledge-base updates)
+# =========================================================
+def invalidate(source: str):
+    """
+    Drop every cached reply that was built from `source`.
+    """
+    with _lock:
+        for scope, store in list(_stores.items()):
+            try:
+                stale = [i for i, srcs in store.sources.items() if source in srcs]
+                for _id in stale:
+                    store.remove(_id)
+            except Exception as e:
+                # Never leave stale answers behind: drop the whole scope
+                print("[SEMANTIC CACHE] Invalidate failed, dropping scope", scope, str(e))
+                del _stores[scope]
+
+
+def clear():
+    with _lock:
+        _stores.clear()
@@ -0,0 +1,49 @@
+import os
+import sys
+import types
+import hashlib
+
+import numpy as np
+import pytest
+
+# Must be set before config is imported: no LLM server in tests
+os.environ["LLM_BACKEND"] = "mock"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# =========================================================
+# NO MODEL STACK
+# rag imports sentence_transformers (and with it torch) at module
+# level. Tests never load a model, so stand in a tiny module
+# before anything imports rag.
+# =========================================================
+_st = types.ModuleType("sentence_transformers")
+
+
+class _NoModel:
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("tests must not load an embedding model")
+
+
+_st.SentenceTransformer = _NoModel
+sys.modules["sentence_transformers"] = _st
+
+EMBED_DIM = 384
+
+
+def fake_embed_query(query: str) -> np.ndarray:
+    """Deterministic bag-of-words vector, L2-normalised like the real one."""
+    v = np.full((1, EMBED_DIM), 1e-3, dtype="float32")
+    for word in query.lower().split():
+        h = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:4], "little")
+        v[0, h % EMBED_DIM] += 1.0
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture(autouse=True)
+def _fake_embeddings(monkeypatch):
+    import rag
+    import semantic_cache
+
+    monkeypatch.setattr(rag, "embed_query", fake_embed_query)
+    monkeypatch.setattr(semantic_cache, "embed_query", fake_embed_query)
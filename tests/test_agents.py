@@ -0,0 +1,31 @@
+import agents
+
+
+def test_store_started_before_ingest_is_dropped(monkeypatch):
+    stored = []
+    monkeypatch.setattr(agents.cache, "exact_set", lambda key, reply: stored.append(key))
+
+    before = agents._cache_generation()
+    agents._next_generation("notes.txt")  # what an ingest runs first
+    agents._exact_store("stale", "old answer", before)
+    agents._exact_store("fresh", "new answer", agents._cache_generation())
+
+    assert stored == ["fresh"]
+
+
+def test_cache_key_names_backend_and_prompt_version(monkeypatch):
+    mock_key = agents._cache_key("chat", "student", "what is a rubric?")
+
+    monkeypatch.setattr(agents, "_KEY_PREFIX", ("api", "http://llm:8080", 1))
+    assert agents._cache_key("chat", "student", "what is a rubric?") != mock_key
+
+    api_key = agents._cache_key("chat", "student", "what is a rubric?")
+    monkeypatch.setattr(agents, "_KEY_PREFIX", ("api", "http://llm:8080", 2))
+    assert agents._cache_key("chat", "student", "what is a rubric?") != api_key
+
+
+def test_feedback_key_keeps_case_and_layout():
+    key = agents._cache_key("feedback", raw=("Plan\n- step", "A | 5"))
+    assert key == agents._cache_key("feedback", raw=("Plan\n- step", "A | 5"))
+    assert key != agents._cache_key("feedback", raw=("plan - step", "A | 5"))
+    assert key != agents._cache_key("feedback", raw=("Plan\n- step", "a | 5"))
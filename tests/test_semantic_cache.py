@@ -0,0 +1,44 @@
+import numpy as np
+
+import semantic_cache
+from semantic_cache import HNSW_MIN_ENTRIES, _Store
+
+DIM = 8
+
+
+def _vec(rng):
+    v = rng.standard_normal((1, DIM)).astype("float32")
+    return v / np.linalg.norm(v)
+
+
+def test_invalidate_everything_in_hnsw_scope(monkeypatch):
+    rng = np.random.default_rng(0)
+
+    big, small = _Store(DIM), _Store(DIM)
+    for i in range(HNSW_MIN_ENTRIES):
+        big.add(_vec(rng), f"a{i}", ["docA"])
+    small.add(_vec(rng), "b", ["docA"])
+    assert big.index is not None  # HNSW tier
+
+    monkeypatch.setattr(semantic_cache, "_stores", {"big": big, "small": small})
+    semantic_cache.invalidate("docA")
+
+    # Every store finished, and the emptied HNSW scope is usable again
+    assert not big.replies and not small.replies
+    assert big.index is None and list(big.search(_vec(rng))) == []
+
+    q = _vec(rng)
+    big.add(q, "fresh", ["docB"])
+    assert list(big.search(q))[0][1] in big.replies
+
+
+def test_put_then_get_until_source_changes(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_stores", {})
+    scope = ("student", "default")
+
+    semantic_cache.put("What is photosynthesis?", "reply", scope, ["bio.txt"])
+    assert semantic_cache.get("what is  Photosynthesis?", scope) == "reply"
+    assert semantic_cache.get("what is photosynthesis?", ("lecturer", "default")) is None
+
+    semantic_cache.invalidate("bio.txt")
+    assert semantic_cache.get("what is photosynthesis?", scope) is None